@@ -8,10 +8,13 @@ class BudgetAgent:
     职责：接收 Plan JSON，计算总成本，生成 CSV 报表。
     """
     
-    def calculate(self, plan_json: dict) -> dict:
+    def calculate(self, plan_json: dict, tag: str = None) -> dict:
         """
         计算预算
         
+        Args:
+            tag: 附加在 CSV 文件名中的标识 (如运行 ID)，避免并发运行互相覆盖
+        
         Returns:
             {
                 "total": float,
@@ -59,7 +62,7 @@ class BudgetAgent:
         
         # 生成 CSV
         df = pd.DataFrame(items)
-        filename = f"budget_{plan_json.get('destination', 'trip')}.csv"
+        filename = f"budget_{plan_json.get('destination', 'trip')}{'_' + tag if tag else ''}.csv"
         csv_path = os.path.join(Config.EXPORTS_DIR, filename)
         os.makedirs(Config.EXPORTS_DIR, exist_ok=True)
         df.to_csv(csv_path, index=False, encoding="utf-8-sig")
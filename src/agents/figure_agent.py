@@ -2,6 +2,8 @@ import os
 import shutil
 from src.config import Config
 from src.utils.prompts import PROMPT_FIGURE_GEN
+from src.utils.telemetry import track_external
+from src.services.cassette import cassette_call
 
 class FigureAgent:
     """
@@ -63,8 +65,11 @@ class FigureAgent:
             5.  **Output**: Return ONLY the raw DOT code.
             """
             
-            response = model.generate_content(graphviz_prompt)
-            return response.text
+            def generate():
+                with track_external("gemini", "generate_content"):
+                    return model.generate_content(graphviz_prompt).text
+            
+            return cassette_call("gemini", {"model": "gemini-2.0-flash-exp", "prompt": graphviz_prompt}, generate)
         except Exception as e:
             print(f"Gemini API Error: {e}")
             return None
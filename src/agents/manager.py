@@ -2,8 +2,27 @@ import os
 import json
 from src.config import Config
 from src.utils.prompts import PROMPT_SPECIAL_FORCES, PROMPT_FOODIE, PLAN_OUTPUT_SCHEMA, PROMPT_WRITER
-import requests
-import re
+import time
+import queue
+import threading
+import contextvars
+from typing import Callable, Dict, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.utils.pipeline import StageGraph
+from src.utils.context_packer import ContextPacker, count_tokens
+from src.utils.plan_codec import encode_plan_for_llm
+from src.utils.dedup import content_hash, near_duplicate_clusters
+from src.utils.rerank import BM25Reranker
+from src.utils.json_stream import extract_first_json_object, StreamingJSONParser
+from src.utils.telemetry import RunTrace, current_trace, use_trace, stage_scope, track_external, record_llm_call, export_trace, use_log_sink
+from src.services.http_client import get_transport
+from src.services.llm_cache import get_llm_cache
+from src.services.health import health_registry
+
+def _is_llm_outage(error: Exception) -> bool:
+    """4xx 参数错误不计入熔断 (限流 429 除外)"""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is None or status >= 500 or status == 429
 
 class AgentManager:
     """
@@ -14,7 +33,39 @@ class AgentManager:
         self.model = "gpt-5.2-chat-latest"
         self.temperature = 0.7
 
-    def _call_chat_completions(self, system_message: str, user_message: str, temperature: float = None) -> str:
+    def _call_chat_completions(self, system_message: str, user_message: str, temperature: float = None,
+                               cache: bool = None, on_delta: Callable[[str], None] = None,
+                               accept: Callable[[str], bool] = bool) -> str:
+        """
+        调用 Chat Completions
+        
+        Args:
+            cache: 是否走响应缓存 (需开启 LLM_CACHE_ENABLED)。
+                   默认仅缓存温度不高于 LLM_CACHE_MAX_TEMPERATURE 的确定性调用。
+            on_delta: 传入时以 SSE 流式请求，每收到一段增量文本即回调一次
+            accept: 回复是否可缓存 (默认非空即缓存)；不可用的回复不缓存，下次重新请求
+        
+        Returns:
+            完整的回复文本
+        """
+        temperature = self.temperature if temperature is None else temperature
+        messages = [
+            {"role": "system", "content": system_message or ""},
+            {"role": "user", "content": user_message or ""},
+        ]
+        
+        if cache is None:
+            cache = temperature <= Config.LLM_CACHE_MAX_TEMPERATURE
+        llm_cache = get_llm_cache() if cache else None
+        if llm_cache:
+            cache_key = llm_cache.make_key(self.model, messages, temperature)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                record_llm_call(0.0, cached=True, stream=bool(on_delta))
+                if on_delta:
+                    on_delta(cached)
+                return cached
+        
         if not Config.OPENAI_API_KEY:
             raise RuntimeError("OPENAI_API_KEY not found in environment.")
 
@@ -22,228 +73,656 @@ class AgentManager:
         url = f"{base_url}/chat/completions"
         payload = {
             "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_message or ""},
-                {"role": "user", "content": user_message or ""},
-            ],
-            "temperature": self.temperature if temperature is None else temperature,
+            "messages": messages,
+            "temperature": temperature,
         }
         headers = {
             "Authorization": f"Bearer {Config.OPENAI_API_KEY}",
             "Content-Type": "application/json",
         }
 
-        resp = requests.post(url, json=payload, headers=headers, timeout=120)
-        resp.raise_for_status()
-        data = resp.json()
-        return (data.get("choices") or [{}])[0].get("message", {}).get("content", "") or ""
+        started = time.time()
+        with health_registry.guard("llm", is_failure=_is_llm_outage), track_external("llm", "chat_completions"):
+            if on_delta:
+                payload["stream"] = True
+                payload["stream_options"] = {"include_usage": True}
+                resp = get_transport().post(url, json=payload, headers=headers, stream=True)
+                resp.raise_for_status()
+                content, usage = self._read_sse_stream(resp, on_delta)
+            else:
+                resp = get_transport().post(url, json=payload, headers=headers)
+                resp.raise_for_status()
+                data = resp.json()
+                content = (data.get("choices") or [{}])[0].get("message", {}).get("content", "") or ""
+                usage = data.get("usage")
+        record_llm_call(time.time() - started, usage, stream=bool(on_delta))
+        if llm_cache and accept(content):
+            llm_cache.put(cache_key, content)
+        return content
+
+    def _read_sse_stream(self, resp, on_delta: Callable[[str], None]) -> tuple:
+        """
+        解析 Chat Completions 的 SSE 流 (data: {...} / data: [DONE])
+        
+        Returns:
+            (拼接后的全文, usage 字典或 None)
+        """
+        resp.encoding = "utf-8"
+        parts = []
+        usage = None
+        try:
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+        finally:
+            resp.close()
+        return "".join(parts), usage
 
     def _extract_first_json_object(self, text: str) -> dict:
-        if not text:
-            return {}
-        match = re.search(r"(\{.*\})", text, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(1))
-            except json.JSONDecodeError:
-                return {}
+        return extract_first_json_object(text)
+
+    def _extract_kg_batch(self, batch_text: str) -> dict:
+        """对单个批次调用 LLM 抽取知识图谱，返回 {"nodes": [...], "relationships": [...]}"""
+        extraction_prompt = f"""
+        You are an expert Knowledge Graph Builder. Your task is to extract structured knowledge from the provided travel notes.
+        
+        ### Ontology Schema
+        - **Nodes**:
+            - `Place` (name, type=spot/restaurant/hotel/transport)
+            - `Food` (name, cuisine_type)
+            - `Activity` (name, duration)
+            - `Price` (value, currency)
+            - `Tag` (name)
+        - **Relationships**:
+            - `(:Place)-[:LOCATED_IN]->(:Place)` (e.g., Spot in City)
+            - `(:Place)-[:HAS_COST]->(:Price)`
+            - `(:Place)-[:OFFERS]->(:Food)`
+            - `(:Place)-[:SUITABLE_FOR]->(:Activity)`
+            - `(:Place)-[:HAS_TAG]->(:Tag)`
+            - `(:Place)-[:NEARBY]->(:Place)` (Implicit distance)
+        
+        ### Input Text
+        {batch_text} 
+        
+        ### Output Format
+        Return a SINGLE JSON object with "nodes" and "relationships".
+        {{
+          "nodes": [{{"id": "...", "type": "...", "properties": {{"name": "...", ...}}}}],
+          "relationships": [{{"source": "...", "source_type": "...", "target": "...", "target_type": "...", "type": "..."}}]
+        }}
+        """
+        kg_response = self._call_chat_completions(
+            system_message="You are an expert Knowledge Graph Builder.",
+            user_message=extraction_prompt,
+            temperature=0.2,
+            accept=self._is_kg_output
+        )
+        return self._parse_kg_output(kg_response)
+
+    @staticmethod
+    def _parse_kg_output(text: str) -> dict:
+        """
+        解析抽取结果；缺少 nodes 列表 (拒答、结构不符) 时抛出 ValueError，
+        使该批次计为失败、文档不登记为已入库，下次运行重新抽取
+        """
+        kg_data = extract_first_json_object(text)
+        if not kg_data:
+            raise ValueError("no valid JSON object in extraction output")
+        nodes = kg_data.get("nodes")
+        relationships = kg_data.get("relationships")
+        if relationships is None:
+            relationships = []
+        if not isinstance(nodes, list) or not isinstance(relationships, list):
+            raise ValueError(f"extraction output has no nodes/relationships lists (keys: {sorted(kg_data)[:5]})")
+        return {"nodes": nodes, "relationships": relationships}
+
+    @classmethod
+    def _is_kg_output(cls, text: str) -> bool:
         try:
-            return json.loads(text)
-        except Exception:
-            return {}
+            cls._parse_kg_output(text)
+        except ValueError:
+            return False
+        return True
+
+    def _build_knowledge_graph(self, neo4j, all_docs: list, batch_size: int = None, max_concurrency: int = None,
+                               destination: str = None) -> dict:
+        """
+        分批并发构建知识图谱
+        
+        每个批次在线程池中独立完成 "LLM 抽取 -> Neo4j 写入"，因此一个批次的写入
+        与其他批次的 LLM 调用相互重叠。单个批次失败不影响其他批次。
+        给出 destination 时，实体记录来源目的地与批内提到它的文档哈希，批次文档登记为已入库。
+        
+        Returns:
+            {
+                "total_nodes": int,
+                "succeeded": [batch_no, ...],
+                "failed": {batch_no: error_message}
+            }
+        """
+        batch_size = batch_size or Config.KG_BATCH_SIZE
+        max_concurrency = max(1, max_concurrency or Config.KG_MAX_CONCURRENCY)
+        
+        batches = [all_docs[i:i+batch_size] for i in range(0, len(all_docs), batch_size)]
+        
+        def process(batch_no: int, batch: list) -> int:
+            started = time.time()
+            with stage_scope("kg_batch"):
+                try:
+                    added = extract_and_write(batch)
+                except Exception:
+                    record_stage(f"kg_batch_{batch_no}", time.time() - started, "failed")
+                    raise
+            record_stage(f"kg_batch_{batch_no}", time.time() - started, "ok")
+            return added
+        
+        def record_stage(name: str, elapsed: float, status: str):
+            trace = current_trace()
+            if trace:
+                trace.record_stage(name, elapsed, status)
+        
+        def extract_and_write(batch: list) -> int:
+            # 批内每篇文档平分 token 预算，避免长文挤占其他文档
+            budget = Config.CONTEXT_BUDGET_KG_BATCH
+            packer = ContextPacker(budget, max_tokens_per_snippet=budget // len(batch))
+            for d in batch:
+                packer.add(d["source"], d["text"])
+            packed = packer.pack()
+            batch_text = "\n---\n".join(line for lines in packed.sections.values() for line in lines)
+            kg_data = self._extract_kg_batch(batch_text)
+            nodes_list = kg_data["nodes"]
+            # 没有抽取到实体的批次也要登记文档，避免下次重复抽取
+            if nodes_list or destination is not None:
+                neo4j.create_graph_data(nodes_list, kg_data["relationships"], destination=destination,
+                                        documents=batch)
+            return len(nodes_list)
+        
+        report = {"total_nodes": 0, "succeeded": [], "failed": {}}
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches) or 1)) as pool:
+            # 每个任务复制一份上下文，使批次内的调用记录到当前 trace
+            futures = {pool.submit(contextvars.copy_context().run, process, no, batch): no
+                       for no, batch in enumerate(batches, start=1)}
+            for future in as_completed(futures):
+                batch_no = futures[future]
+                try:
+                    added = future.result()
+                except Exception as e:
+                    report["failed"][batch_no] = str(e)
+                    print(f"[Warning] Batch {batch_no} failed: {e}")
+                    continue
+                report["succeeded"].append(batch_no)
+                report["total_nodes"] += added
+                print(f"[Manager] Batch {batch_no}: Added {added} nodes.")
+        
+        report["succeeded"].sort()
+        if report["failed"]:
+            print(f"[Manager] KG batches: {len(report['succeeded'])} succeeded, {len(report['failed'])} failed {sorted(report['failed'])}.")
+        return report
+
+    def _dedup_documents(self, notes: list, ds_results: list) -> dict:
+        """
+        跨来源折叠近似重复的文档 (转载、搬运、SEO 复制)
+        每个重复簇保留内容最长的一篇，并在 "duplicates" 中记录其余各篇的来源。
+        
+        Returns:
+            {"notes": list, "ds_results": list, "report": dict}
+        """
+        docs = [("XHS", n) for n in notes] + [("Web", r) for r in ds_results]
+        if not Config.DEDUP_ENABLED or len(docs) < 2:
+            return {"notes": notes, "ds_results": ds_results, "report": None}
+        
+        def text_of(doc):
+            return f"{doc.get('title') or ''}\n{doc.get('content') or ''}"
+        
+        clusters = near_duplicate_clusters([text_of(d) for _, d in docs], threshold=Config.DEDUP_THRESHOLD,
+                                           num_perm=Config.DEDUP_NUM_PERM, shingle_size=Config.DEDUP_SHINGLE_SIZE)
+        kept_notes, kept_web, removed_tokens = [], [], 0
+        for cluster in clusters:
+            keep = max(cluster, key=lambda i: (len(docs[i][1].get("content") or ""), -i))
+            source, doc = docs[keep]
+            if len(cluster) > 1:
+                doc = dict(doc, duplicates=[
+                    {"source": docs[i][0], "id": docs[i][1].get("id"), "title": docs[i][1].get("title"),
+                     "url": docs[i][1].get("url")}
+                    for i in cluster if i != keep
+                ])
+                removed_tokens += sum(count_tokens(text_of(docs[i][1])) for i in cluster if i != keep)
+            (kept_notes if source == "XHS" else kept_web).append(doc)
+        
+        batch_size = Config.KG_BATCH_SIZE
+        report = {
+            "docs_before": len(docs),
+            "docs_after": len(clusters),
+            "duplicates_removed": len(docs) - len(clusters),
+            "tokens_removed": removed_tokens,
+            "kg_calls_saved": -(-len(docs) // batch_size) - (-(-len(clusters) // batch_size)),
+        }
+        print(f"[Manager] Dedup: {report['docs_before']} -> {report['docs_after']} docs, "
+              f"~{report['tokens_removed']} tokens and {report['kg_calls_saved']} KG extraction calls saved.")
+        return {"notes": kept_notes, "ds_results": kept_web, "report": report}
+
+    # 按旅行模式补充到重排查询中的关键词
+    RERANK_MODE_TERMS = {
+        "特种兵": "景点 打卡 路线 门票 交通 攻略",
+        "吃货": "美食 小吃 餐厅 人均 排队 推荐",
+    }
+
+    def _rerank_documents(self, query: str, notes: list, ds_results: list) -> list:
+        """
+        对小红书与全网结果统一打分重排 (字符 bigram BM25 + 时效 + 互动量)
+        
+        Returns:
+            [(source, doc), ...] 按得分从高到低，source 为 "xhs" / "web"
+        """
+        docs = [("xhs", n) for n in notes] + [("web", r) for r in ds_results]
+        started = time.time()
+        order = BM25Reranker().rerank(query, [d for _, d in docs],
+                                      lambda d: f"{d.get('title') or ''} {d.get('content') or ''}")
+        print(f"[Manager] Reranked {len(docs)} docs in {(time.time() - started) * 1000:.1f}ms.")
+        return [docs[i] for i in order]
+
+    @staticmethod
+    def _top_k(ranked: list, k: int) -> list:
+        """取重排后的前 k 篇 (k <= 0 表示全部)，保持 [(来源, 文档)] 的全局得分顺序"""
+        return ranked[:k] if k > 0 else ranked
+
+    def _pack_context(self, ranked: list, budget: int, stage: str) -> str:
+        """
+        在 token 预算内打包检索结果，按重排后的全局排名从高到低填充，不按来源轮流取
+        """
+        packer = ContextPacker(budget, max_tokens_per_snippet=Config.CONTEXT_MAX_TOKENS_PER_DOC)
+        for rank, (source, d) in enumerate(ranked):
+            if source == "xhs":
+                line = f"- [小红书] {d.get('title')} (Source: {d.get('url')}): {d.get('content') or ''}"
+            else:
+                line = f"- [{d.get('title')}]({d.get('url')}): {d.get('content') or ''}"
+            packer.add(source, line, priority=1.0 / (1 + rank))
+        packed = packer.pack()
+        print(f"[Manager] Context for {stage}: {packed.summary()}")
+        return packed.render({"xhs": "【小红书热点 ({count}篇)】", "web": "【全网搜索 ({count}篇)】"})
+
+    def _graph_context(self, destination: str, mode: str):
+        """
+        读取持久化图谱中该目的地的摘要，渲染为规划 Prompt 中的结构化事实
+        图谱中的地点少于 GRAPH_CONTEXT_MIN_SPOTS 时返回 None (新目的地首次规划只能依赖原文)
+        """
+        if not Config.GRAPH_CONTEXT_ENABLED:
+            return None
+        from src.services.neo4j_service import get_graph_service
+        summary = get_graph_service().graph_summary(destination, mode)
+        if len(summary["spots"]) < Config.GRAPH_CONTEXT_MIN_SPOTS:
+            print(f"[Manager] Graph has {len(summary['spots'])} spots for {destination}, using raw context only.")
+            return None
+        
+        lines = [f"【知识图谱摘要 ({destination}，由历史笔记抽取的结构化事实，提及数 = 该目的地提到它的来源笔记数)】", "热门地点:"]
+        for spot in summary["spots"]:
+            line = f"- {spot['name']} (提及 {spot['mentions']})"
+            if spot["prices"]:
+                line += f" | 价格: {'、'.join(spot['prices'])}"
+            if spot["tags"]:
+                line += f" | 标签: {'、'.join(spot['tags'])}"
+            lines.append(line)
+        if summary["food"]:
+            lines.append("区域美食:")
+            lines += [f"- {area['area']}: {'、'.join(area['foods'])}" for area in summary["food"]]
+        if summary["clusters"]:
+            lines.append("邻近地点群 (适合安排在同一天):")
+            lines += [f"- {' / '.join(cluster)}" for cluster in summary["clusters"]]
+        context = "\n".join(lines)
+        print(f"[Manager] Graph context for {destination}: {len(summary['spots'])} spots, "
+              f"{len(summary['food'])} food areas, {len(summary['clusters'])} clusters, {count_tokens(context)} tokens.")
+        return context
 
-    def run_flow(self, user_input: str, mode: str):
+    def _submit_graph_ingestion(self, destination: str, all_docs: list):
+        """
+        将知识图谱构建交给后台入库队列，立即返回任务句柄 (失败时返回 None)
+        """
+        if not all_docs:
+            return None
+        
+        parent = current_trace()
+        
+        def build() -> dict:
+            # 后台任务单独记录一条 trace，关联到发起它的 run
+            trace = RunTrace("kg_ingestion", destination=destination, doc_count=len(all_docs),
+                             parent_run_id=parent.run_id if parent else None)
+            with use_trace(trace):
+                try:
+                    from src.services.neo4j_service import get_graph_service
+                    neo4j = get_graph_service()
+                    
+                    # 1. 增量入库：跳过该目的地已入库的文档 (按内容哈希)；
+                    #    关闭增量时先清理该目的地的旧数据再全量重建，不影响其他目的地
+                    if Config.KG_INCREMENTAL:
+                        seen = neo4j.known_documents(destination, [d["hash"] for d in all_docs])
+                    else:
+                        neo4j.purge_destination(destination)
+                        seen = set()
+                    new_docs = []
+                    for d in all_docs:
+                        if d["hash"] not in seen:
+                            seen.add(d["hash"])
+                            new_docs.append(d)
+                    skipped = len(all_docs) - len(new_docs)
+                    trace.attrs["skipped_docs"] = skipped
+                    if not new_docs:
+                        print(f"[Manager] All {len(all_docs)} documents already in the graph for {destination}, "
+                              f"skipping extraction.")
+                        trace.finish("ok")
+                        return {"total_nodes": 0, "succeeded": [], "failed": {}, "skipped_docs": skipped}
+                    
+                    # 2. 分批并发提取 (防止 Context Overflow)
+                    print(f"[Manager] Extracting KG from {len(new_docs)} new documents ({skipped} already ingested)...")
+                    kg_report = self._build_knowledge_graph(neo4j, new_docs, destination=destination)
+                    kg_report["skipped_docs"] = skipped
+                    print(f"[Manager] Knowledge Graph updated with {kg_report['total_nodes']} nodes total.")
+                    trace.finish("ok" if not kg_report["failed"] else "partial")
+                    return kg_report
+                except Exception:
+                    trace.finish("failed")
+                    raise
+                finally:
+                    export_trace(trace)
+        
+        try:
+            from src.services.graph_ingestion import graph_ingestion_queue
+            return graph_ingestion_queue.submit(destination, len(all_docs), build)
+        except Exception as e:
+            print(f"[Warning] KG Update failed: {e}")
+            return None
+
+    # 各阶段超时 (秒)
+    STAGE_TIMEOUTS = {
+        "xhs_search": 60,
+        "deep_search": 30,
+        "dedup": 10,
+        "rerank": 10,
+        "graph_context": 10,
+        "kg_submit": 10,
+        "plan": 240,
+        "budget": 30,
+        "writer": 300,
+        "map": 120,
+    }
+
+    def run_flow(self, user_input: str, mode: str, with_map: bool = False,
+                 on_event: Callable[[Dict], None] = None):
         """
         运行多智能体流程 (Pipeline 模式：检索 -> 注入 -> 规划)
+        
+        可重入：每次调用的状态 (阶段图、追踪、事件回调、导出文件名) 都是独立的，
+        多个会话可以在同一进程中并发调用同一个 AgentManager。
+        
+        流程被表达为阶段依赖图，互不依赖的阶段并发执行：
+            xhs_search ─┬─> dedup ──> rerank ─┬─> kg_submit
+            deep_search ┘                     └─> plan ──> budget ──> writer
+            graph_context ───────────────────────┘
+                                                       └──────────> map (可选)
+        
+        Args:
+            on_event: 事件回调，用于流式展示：
+                {"type": "stage", "stage": str, "status": str, "elapsed": float}
+                {"type": "delta", "stage": "plan" | "writer", "text": str}
+                {"type": "plan_day", "day": dict}  (行程中某一天生成完毕)
+                {"type": "log", "message": str}  (本次运行的日志行，含各阶段线程中的 print 输出)
         """
+        if on_event is None:
+            return self._run_flow(user_input, mode, with_map, None)
+        with use_log_sink(lambda line: on_event({"type": "log", "message": line})):
+            return self._run_flow(user_input, mode, with_map, on_event)
+
+    def _run_flow(self, user_input: str, mode: str, with_map: bool, on_event: Callable[[Dict], None]):
+        def emit(event: Dict):
+            if on_event:
+                try:
+                    on_event(event)
+                except Exception as e:
+                    print(f"[Warning] Event callback failed: {e}")
+        
+        def delta_sink(stage: str):
+            if not on_event:
+                return None
+            return lambda text: emit({"type": "delta", "stage": stage, "text": text})
+        
+        # 提取目的地作为关键词
+        destination = user_input.split(" ")[0]
+        trace = RunTrace("run_flow", destination=destination, mode=mode)
+        
         try:
             print(f"[Manager] Starting Pipeline Flow for: {user_input}")
             
+            timeouts = self.STAGE_TIMEOUTS
+            
             # --- Step 1: 主动数据检索 ---
-            print("[Manager] Step 1: Collecting Data...")
+            def xhs_search(_):
+                # 1.1 小红书检索
+                from src.services.mcp_client import MCPClient
+                xhs_client = MCPClient()
+                notes = xhs_client.search_facets(destination, limit=30)
+                
+                # 存档 Markdown
+                saved_md_files = xhs_client.save_to_markdown(notes, destination)
+                print(f"[Manager] Saved {len(saved_md_files)} XHS notes to markdown.")
+                return notes
             
-            # 1.1 小红书检索
-            from src.services.mcp_client import MCPClient
-            xhs_client = MCPClient()
-            # 提取目的地作为关键词
-            destination = user_input.split(" ")[0]
-            notes = xhs_client.search_notes(destination, limit=30)
+            def deep_search(_):
+                # 1.2 DeepSearch 检索
+                from src.services.deepsearch_client import DeepSearchClient
+                ds_client = DeepSearchClient()
+                return ds_client.search(f"{user_input} 旅游攻略 {mode}", max_results=5)
             
-            # 存档 Markdown
-            saved_md_files = xhs_client.save_to_markdown(notes, destination)
-            print(f"[Manager] Saved {len(saved_md_files)} XHS notes to markdown.")
+            # --- Step 1.2: 近似重复折叠 (减少抽取批次与 Prompt 中的重复内容) ---
+            def dedup(deps):
+                _, ds_results = deps["deep_search"]
+                try:
+                    result = self._dedup_documents(deps["xhs_search"], ds_results)
+                except Exception as e:
+                    print(f"[Warning] Dedup failed, using raw documents: {e}")
+                    return {"notes": deps["xhs_search"], "ds_results": ds_results, "report": None}
+                if result["report"]:
+                    trace.attrs["dedup"] = result["report"]
+                return result
             
-            xhs_context = "\n".join([f"- [小红书] {n.get('title')}: {n.get('content')[:100]}... (Source: {n.get('url')})" for n in notes])
+            # --- Step 1.3: 相关性重排，各下游阶段按各自的 top-k 取用 ---
+            def rerank(deps):
+                docs = deps["dedup"]
+                mode_terms = next((t for k, t in self.RERANK_MODE_TERMS.items() if k in mode), "")
+                try:
+                    return self._rerank_documents(f"{user_input} {mode_terms}", docs["notes"], docs["ds_results"])
+                except Exception as e:
+                    print(f"[Warning] Rerank failed, keeping retrieval order: {e}")
+                    return [("xhs", n) for n in docs["notes"]] + [("web", r) for r in docs["ds_results"]]
             
-            # 1.2 DeepSearch 检索
-            from src.services.deepsearch_client import DeepSearchClient
-            ds_client = DeepSearchClient()
-            ds_context, ds_results = ds_client.search(f"{user_input} 旅游攻略 {mode}", max_results=5)
+            # --- Step 1.4: 图谱摘要 (读取此前运行积累的图谱，与检索并行) ---
+            def graph_context(_):
+                try:
+                    context = self._graph_context(destination, mode)
+                except Exception as e:
+                    print(f"[Warning] Graph context unavailable, using raw context only: {e}")
+                    return None
+                if context:
+                    trace.attrs["graph_context_tokens"] = count_tokens(context)
+                return context
             
-            # --- Step 1.5: 知识图谱构建 (Enhanced & Batch Processing) ---
-            try:
-                from src.services.neo4j_service import Neo4jService
-                neo4j = Neo4jService()
+            # --- Step 1.5: 知识图谱构建 (后台异步，不阻塞规划) ---
+            def kg_submit(deps):
+                all_docs = []
+                for source, d in self._top_k(deps["rerank"], Config.RERANK_TOP_K_KG):
+                    text = f"Title: {d.get('title')}\nContent: {d.get('content')}"
+                    all_docs.append({"text": text, "source": "XHS" if source == "xhs" else "Web",
+                                     "hash": content_hash(text), "title": d.get("title"), "url": d.get("url")})
+                return self._submit_graph_ingestion(destination, all_docs)
+            
+            # --- Step 2 & 3: 构造 Prompt 并规划、解析结果 ---
+            def plan(deps):
+                ranked = self._top_k(deps["rerank"], Config.RERANK_TOP_K_PLAN)
+                # 有图谱摘要时以结构化事实为主，原文只保留较小的预算作补充
+                graph_facts = deps["graph_context"]
+                budget = Config.CONTEXT_BUDGET_PLAN_GROUNDED if graph_facts else Config.CONTEXT_BUDGET_PLAN
+                full_context = self._pack_context(ranked, budget, "plan")
+                if graph_facts:
+                    full_context = f"{graph_facts}\n\n{full_context}"
+                print(f"[Manager] Data Collected:\n{full_context[:200]}...")
                 
-                # 1. 清空旧数据
-                neo4j.clear_database()
+                print("[Manager] Step 2: Planning with LLM...")
                 
-                # 2. 准备所有待处理文档
-                all_docs = []
-                for n in notes:
-                    all_docs.append({"text": f"Title: {n.get('title')}\nContent: {n.get('content')}", "source": "XHS"})
-                for r in ds_results:
-                    all_docs.append({"text": f"Title: {r.get('title')}\nContent: {r.get('content')}", "source": "Web"})
+                mode_prompt = PROMPT_SPECIAL_FORCES if "特种兵" in mode else PROMPT_FOODIE
                 
-                print(f"[Manager] Extracting KG from {len(all_docs)} documents...")
+                # 动态注入 Schema
+                schema_str = json.dumps(PLAN_OUTPUT_SCHEMA, indent=2, ensure_ascii=False)
                 
-                # 3. 分批提取 (防止 Context Overflow)
-                batch_size = 5
-                total_nodes = 0
+                prompt = f"""
+                你是一个专业的旅行规划师。请根据以下检索到的实时信息，为用户生成一份详细的旅行计划。
                 
-                for i in range(0, len(all_docs), batch_size):
-                    batch = all_docs[i:i+batch_size]
-                    batch_text = "\n---\n".join([d["text"] for d in batch])
-                    
-                    extraction_prompt = f"""
-                    You are an expert Knowledge Graph Builder. Your task is to extract structured knowledge from the provided travel notes.
-                    
-                    ### Ontology Schema
-                    - **Nodes**:
-                        - `Place` (name, type=spot/restaurant/hotel/transport)
-                        - `Food` (name, cuisine_type)
-                        - `Activity` (name, duration)
-                        - `Price` (value, currency)
-                        - `Tag` (name)
-                    - **Relationships**:
-                        - `(:Place)-[:LOCATED_IN]->(:Place)` (e.g., Spot in City)
-                        - `(:Place)-[:HAS_COST]->(:Price)`
-                        - `(:Place)-[:OFFERS]->(:Food)`
-                        - `(:Place)-[:SUITABLE_FOR]->(:Activity)`
-                        - `(:Place)-[:HAS_TAG]->(:Tag)`
-                        - `(:Place)-[:NEARBY]->(:Place)` (Implicit distance)
-                    
-                    ### Input Text
-                    {batch_text[:3000]} 
-                    
-                    ### Output Format
-                    Return a SINGLE JSON object with "nodes" and "relationships".
-                    {{
-                      "nodes": [{{"id": "...", "type": "...", "properties": {{"name": "...", ...}}}}],
-                      "relationships": [{{"source": "...", "source_type": "...", "target": "...", "target_type": "...", "type": "..."}}]
-                    }}
-                    """
-                    kg_response = self._call_chat_completions(
-                        system_message="You are an expert Knowledge Graph Builder.",
-                        user_message=extraction_prompt,
-                        temperature=0.2
-                    )
-                    
-                    # 解析并写入
-                    import re
-                    kg_match = re.search(r"(\{.*\})", kg_response, re.DOTALL)
-                    if kg_match:
-                        try:
-                            kg_data = json.loads(kg_match.group(1))
-                            nodes_list = kg_data.get("nodes", [])
-                            rels_list = kg_data.get("relationships", [])
-                            if nodes_list:
-                                neo4j.create_graph_data(nodes_list, rels_list)
-                                total_nodes += len(nodes_list)
-                                print(f"[Manager] Batch {i//batch_size + 1}: Added {len(nodes_list)} nodes.")
-                        except json.JSONDecodeError:
-                            print(f"[Warning] Batch {i//batch_size + 1} JSON decode failed.")
-                            
-                print(f"[Manager] Knowledge Graph built with {total_nodes} nodes total.")
+                用户需求: {user_input}
+                旅行模式: {mode}
                 
-            except Exception as e:
-                print(f"[Warning] KG Update failed: {e}")
-                import traceback
-                traceback.print_exc()
-            
-            full_context = f"【小红书热点 (10篇)】\n{xhs_context}\n\n【全网搜索 (5篇)】\n{ds_context}"
-            print(f"[Manager] Data Collected:\n{full_context[:200]}...")
-            
-            # --- Step 2: 构造 Prompt 并规划 ---
-            print("[Manager] Step 2: Planning with LLM...")
-            
-            mode_prompt = PROMPT_SPECIAL_FORCES if "特种兵" in mode else PROMPT_FOODIE
-            
-            # 动态注入 Schema
-            schema_str = json.dumps(PLAN_OUTPUT_SCHEMA, indent=2, ensure_ascii=False)
-            
-            prompt = f"""
-            你是一个专业的旅行规划师。请根据以下检索到的实时信息，为用户生成一份详细的旅行计划。
-            
-            用户需求: {user_input}
-            旅行模式: {mode}
-            
-            参考信息:
-            {full_context}
+                参考信息:
+                {full_context}
+                
+                模式要求:
+                {mode_prompt}
+                
+                输出格式:
+                请直接输出一个合法的 JSON 对象，不要包含 Markdown 代码块标记（如 ```json），也不要包含其他废话。
+                JSON 结构必须严格符合以下 Schema：
+                {schema_str}
+                """
+                
+                # 流式解析：每完成一天即推送 plan_day 事件
+                plan_parser = StreamingJSONParser("itinerary")
+                plan_delta = delta_sink("plan")
+                
+                def on_plan_delta(text):
+                    plan_delta(text)
+                    for day in plan_parser.feed(text):
+                        emit({"type": "plan_day", "day": day})
+                
+                content = self._call_chat_completions(
+                    system_message="你是一个专业的旅行规划师。",
+                    user_message=prompt,
+                    temperature=0.7,
+                    on_delta=on_plan_delta if on_event else None
+                )
+                
+                print(f"[Manager] Planner Output: {content[:100]}...")
+                
+                plan_data = plan_parser.result() if on_event else self._extract_first_json_object(content)
+                if not plan_data:
+                    raise ValueError("planner returned no JSON plan")
+                return {"plan": plan_data}
             
-            模式要求:
-            {mode_prompt}
+            # --- Step 4: 预算计算 (Post-Processing) ---
+            def budget(deps):
+                from src.agents.budget_agent import BudgetAgent
+                budget_agent = BudgetAgent()
+                return budget_agent.calculate(deps["plan"]["plan"], tag=trace.run_id)
             
-            输出格式:
-            请直接输出一个合法的 JSON 对象，不要包含 Markdown 代码块标记（如 ```json），也不要包含其他废话。
-            JSON 结构必须严格符合以下 Schema：
-            {schema_str}
-            """
+            # --- Step 5: 深度指南写作 (Writer Agent) ---
+            def writer(deps):
+                print("[Manager] Step 5: Writing Guide...")
+                plan_data = dict(deps["plan"]["plan"])
+                budget_res = deps["budget"]
+                if budget_res:
+                    plan_data["total_budget_estimate"] = budget_res["total"]
+                
+                # 紧凑编码：去掉内部字段，最小分隔符，避免原始笔记重复进入 Prompt
+                plan_text = encode_plan_for_llm(plan_data, terse=Config.PLAN_ENCODING == "terse")
+                pretty_size = len(json.dumps(plan_data, ensure_ascii=False, indent=2))
+                print(f"[Manager] Writer plan encoding ({Config.PLAN_ENCODING}): {len(plan_text)} chars, "
+                      f"{count_tokens(plan_text)} tokens (pretty JSON: {pretty_size} chars)")
+                
+                writer_msg = f"""
+                {PROMPT_WRITER}
+                
+                以下是已经生成的【旅行计划 JSON】和【原始检索数据】，请基于此写作：
+                
+                【旅行计划】:
+                {plan_text}
+                
+                【原始数据】:
+                {self._pack_context(self._top_k(deps["rerank"], Config.RERANK_TOP_K_WRITER), Config.CONTEXT_BUDGET_WRITER, "writer")}
+                
+                请直接输出 Markdown 内容，不要包含 JSON 代码块。
+                """
+                guide_content = self._call_chat_completions(
+                    system_message="你是旅行专栏作家。负责撰写深度游玩指南。",
+                    user_message=writer_msg,
+                    temperature=0.7,
+                    on_delta=delta_sink("writer")
+                )
+                
+                # 保存为文件 (带运行 ID，避免并发会话互相覆盖)
+                guide_filename = f"guide_{destination}_{mode[:2]}_{trace.run_id}.md"
+                guide_path = os.path.join(Config.EXPORTS_DIR, guide_filename)
+                os.makedirs(Config.EXPORTS_DIR, exist_ok=True)
+                with open(guide_path, "w", encoding="utf-8") as f:
+                    f.write(guide_content)
+                return {"content": guide_content, "path": guide_path}
             
-            # 直接调用 user_proxy (它实际上是一个 wrapper，我们可以借用它的 client 或者直接用 openai)
-            # 为了保持 AutoGen 风格，我们还是用 initiate_chat，但只跟 Planner 聊一轮
-            content = self._call_chat_completions(
-                system_message="你是一个专业的旅行规划师。",
-                user_message=prompt,
-                temperature=0.7
-            )
+            # --- Step 6: 路线图 (Figure Agent，可选，与写作并行) ---
+            def draw_map(deps):
+                from src.agents.figure_agent import FigureAgent
+                return FigureAgent().generate_map(deps["plan"]["plan"])
             
-            print(f"[Manager] Planner Output: {content[:100]}...")
+            def on_stage(name, status, elapsed):
+                if status != "running":
+                    trace.record_stage(name, elapsed, status)
+                emit({"type": "stage", "stage": name, "status": status, "elapsed": elapsed})
             
-            # --- Step 3: 解析结果 ---
-            plan_data = self._extract_first_json_object(content)
+            graph = StageGraph(on_stage=on_stage)
+            graph.add("xhs_search", xhs_search, timeout=timeouts["xhs_search"], fallback=[])
+            graph.add("deep_search", deep_search, timeout=timeouts["deep_search"], fallback=("", []))
+            graph.add("dedup", dedup, deps=("xhs_search", "deep_search"), timeout=timeouts["dedup"])
+            graph.add("rerank", rerank, deps=("dedup",), timeout=timeouts["rerank"])
+            graph.add("graph_context", graph_context, timeout=timeouts["graph_context"], fallback=None)
+            graph.add("kg_submit", kg_submit, deps=("rerank",), timeout=timeouts["kg_submit"], fallback=None)
+            graph.add("plan", plan, deps=("rerank", "graph_context"), timeout=timeouts["plan"])
+            graph.add("budget", budget, deps=("plan",), timeout=timeouts["budget"], fallback=None)
+            graph.add("writer", writer, deps=("rerank", "plan", "budget"), timeout=timeouts["writer"],
+                      fallback={"content": "", "path": None})
+            if with_map:
+                graph.add("map", draw_map, deps=("plan",), timeout=timeouts["map"], fallback=None)
             
-            # --- Step 4: 预算计算 (Post-Processing) ---
-            from src.agents.budget_agent import BudgetAgent
-            budget_agent = BudgetAgent()
-            budget_res = budget_agent.calculate(plan_data)
+            with use_trace(trace):
+                results = graph.run()
             
-            # 更新 Plan JSON 中的总价，并附带 CSV 路径
-            plan_data["total_budget_estimate"] = budget_res["total"]
-            plan_data["budget_csv"] = budget_res["csv_path"]
+            # --- 汇总结果 ---
+            plan_data = results["plan"]["plan"]
+            budget_res = results["budget"]
+            if budget_res:
+                # 更新 Plan JSON 中的总价，并附带 CSV 路径
+                plan_data["total_budget_estimate"] = budget_res["total"]
+                plan_data["budget_csv"] = budget_res["csv_path"]
             
             # 附加原始检索数据供前端展示
-            plan_data["_raw_notes"] = notes 
-            
-            # --- Step 5: 深度指南写作 (Writer Agent) ---
-            print("[Manager] Step 5: Writing Guide...")
-            writer_msg = f"""
-            {PROMPT_WRITER}
+            plan_data["_raw_notes"] = results["dedup"]["notes"]
+            plan_data["_dedup"] = results["dedup"]["report"]
+            kg_job = results["kg_submit"]
+            plan_data["kg_job_id"] = kg_job.id if kg_job else None
             
-            以下是已经生成的【旅行计划 JSON】和【原始检索数据】，请基于此写作：
+            plan_data["detailed_guide"] = results["writer"]["content"]
+            plan_data["guide_file"] = results["writer"]["path"]
+            if with_map:
+                plan_data["map_code"] = results["map"]
+            plan_data["_stage_timings"] = graph.timings
             
-            【旅行计划】:
-            {json.dumps(plan_data, ensure_ascii=False, indent=2)}
-            
-            【原始数据】:
-            {full_context}
-            
-            请直接输出 Markdown 内容，不要包含 JSON 代码块。
-            """
-            guide_content = self._call_chat_completions(
-                system_message="你是旅行专栏作家。负责撰写深度游玩指南。",
-                user_message=writer_msg,
-                temperature=0.7
-            )
-            
-            # 保存为文件
-            guide_filename = f"guide_{destination}_{mode[:2]}.md"
-            guide_path = os.path.join(Config.EXPORTS_DIR, guide_filename)
-            with open(guide_path, "w", encoding="utf-8") as f:
-                f.write(guide_content)
-                
-            plan_data["detailed_guide"] = guide_content
-            plan_data["guide_file"] = guide_path
+            trace.finish("ok")
+            export_trace(trace)
+            plan_data["_trace_id"] = trace.run_id
             
             return plan_data
 
@@ -251,8 +730,31 @@ class AgentManager:
             print(f"[Error] Pipeline flow failed: {e}")
             import traceback
             traceback.print_exc()
+            trace.finish("failed")
+            export_trace(trace)
             return {}
 
+    def run_flow_stream(self, user_input: str, mode: str, with_map: bool = False) -> Iterator[Dict]:
+        """
+        以生成器形式运行 run_flow，逐个产出事件 (见 run_flow 的 on_event)，
+        最后产出 {"type": "result", "plan": dict}
+        """
+        events: "queue.Queue[Dict]" = queue.Queue()
+        
+        def worker():
+            plan = {}
+            try:
+                plan = self.run_flow(user_input, mode, with_map=with_map, on_event=events.put)
+            finally:
+                events.put({"type": "result", "plan": plan})
+        
+        threading.Thread(target=worker, name="run-flow", daemon=True).start()
+        while True:
+            event = events.get()
+            yield event
+            if event["type"] == "result":
+                return
+
 
 # 单例
 manager = AgentManager()
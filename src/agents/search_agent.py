@@ -1,6 +1,6 @@
 from typing import Dict, Any
 from src.services.mcp_client import MCPClient
-from src.services.neo4j_service import Neo4jService
+from src.services.neo4j_service import get_graph_service
 
 class SearchAgent:
     """
@@ -13,7 +13,7 @@ class SearchAgent:
     
     def __init__(self):
         self.mcp = MCPClient()
-        self.neo4j = Neo4jService()
+        self.neo4j = get_graph_service()
         
     def run(self, query: str) -> Dict[str, Any]:
         """
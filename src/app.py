@@ -9,7 +9,12 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.config import Config
 from src.utils.prompts import PROMPT_SPECIAL_FORCES, PROMPT_FOODIE
-from src.agents.manager import manager  # 引入 AgentManager
+from src.services.plan_jobs import plan_job_queue, PlanQueueFull
+from src.services.health import health_registry
+from src.utils.telemetry import start_metrics_server
+
+# Prometheus /metrics 端点 (配置 METRICS_PORT 时启动，进程内仅一次)
+start_metrics_server()
 
 # 设置页面配置
 st.set_page_config(
@@ -39,7 +44,23 @@ with st.sidebar:
     )
     
     st.markdown("### 系统状态")
-    st.success("✅ 实时模式 (API 已连接)")
+    # 各后端熔断状态 (尚未调用过的后端显示为未检测)
+    BACKEND_LABELS = {"llm": "LLM", "mcp": "小红书 MCP", "neo4j": "Neo4j"}
+    health = health_registry.snapshot()
+    for name, label in BACKEND_LABELS.items():
+        h = health.get(name)
+        if name == "neo4j" and Config.GRAPH_BACKEND == "memory":
+            st.info(f"🧠 {label}: 使用内存图谱")
+        elif h is None:
+            st.caption(f"⚪ {label}: 未检测")
+        elif h["state"] == "open":
+            st.error(f"⛔ {label}: 熔断中，{h['retry_in']:.0f}s 后重试 ({h['last_error']})")
+        elif h["state"] == "half_open":
+            st.warning(f"🟡 {label}: 探测恢复中")
+        elif h["failures"]:
+            st.warning(f"⚠️ {label}: 连续失败 {h['failures']} 次")
+        else:
+            st.success(f"✅ {label}: 正常")
         
     st.divider()
     
@@ -53,6 +74,20 @@ with st.sidebar:
     st.markdown("---")
     st.caption(f"v1.0.0 | Env: {os.getenv('CONDA_DEFAULT_ENV', 'unknown')}")
 
+def render_day_markdown(day: dict) -> str:
+    """将行程中的一天渲染为 Markdown"""
+    day_md = f"#### 📅 第{day.get('day')}天：{day.get('date', '')}\n"
+    
+    # 显示住宿
+    acc = day.get("accommodation", {})
+    if acc:
+        day_md += f"> 🏨 **住宿**: {acc.get('name')} (💰{acc.get('cost', 0)}) - _{acc.get('reason')}_\n\n"
+        
+    for act in day.get("activities", []):
+        cost = act.get("cost", 0)
+        day_md += f"*   **{act.get('time')}** {act.get('name')} ({act.get('type')}) - 💰{cost}\n    *   _{act.get('description')}_\n"
+    return day_md + "\n"
+
 # 主聊天区
 st.title("✈️ The Real Lazy Person")
 st.caption("基于 AutoGen + 小红书 MCP + Neo4j 的智能旅行规划系统")
@@ -68,33 +103,75 @@ if prompt := st.chat_input("输入目的地和天数..."):
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
+    
+    # 提交规划任务：在后台线程池中执行，页面刷新/重新运行不会中断
+    try:
+        st.query_params["job"] = plan_job_queue.submit(prompt, mode, with_map=True).id
+    except PlanQueueFull as e:
+        st.warning(f"⏳ 当前规划任务较多，请稍后再试。({e})")
 
-    # 2. 系统响应 (模拟 Agent 思考过程)
+# 2. 跟踪进行中的规划任务 (任务 ID 保存在 URL 中，刷新页面后重新订阅其事件)
+job = plan_job_queue.get(st.query_params.get("job", ""))
+if job:
+    mode = job.mode
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         full_response = ""
         
         # 模拟中间状态
         with st.status("正在召唤智能体集群 (Real Flow)...", expanded=True) as status:
-            import io
-            from contextlib import redirect_stdout
+            STAGE_LABELS = {
+                "xhs_search": "📕 小红书检索",
+                "deep_search": "🌐 全网搜索",
+                "dedup": "🔁 近似重复折叠",
+                "rerank": "📊 相关性重排",
+                "graph_context": "🧭 图谱摘要",
+                "kg_submit": "🕸️ 知识图谱入队",
+                "plan": "🧠 行程规划",
+                "budget": "💰 预算计算",
+                "writer": "✍️ 深度指南写作",
+                "map": "🗺️ 路线图绘制",
+            }
             
-            # 捕获 AutoGen 的控制台输出
-            f = io.StringIO()
-            with redirect_stdout(f):
-                try:
-                    # 调用 Agent Manager
-                    st.write("🚀 初始化 Agent Manager...")
-                    plan_json = manager.run_flow(prompt, mode)
-                except Exception as e:
-                    st.error(f"Execution Error: {e}")
-                    plan_json = {}
+            # 本次运行的日志通过事件回调获取 (不替换全局 sys.stdout，多会话互不串扰)
+            log_lines = []
+            try:
+                # 订阅任务事件 (从头回放，已完成的部分立即渲染)
+                st.write("🚀 初始化 Agent Manager...")
+                if job.subscribers > 1:
+                    st.write(f"🔗 {job.subscribers} 个相同请求共享此规划任务")
+                plan_json = {}
+                plan_progress = st.empty()
+                plan_chars = 0
+                guide_stream = ""
+                days_stream = ""
+                for event in job.stream():
+                    if event["type"] == "log":
+                        log_lines.append(event["message"])
+                    elif event["type"] == "stage" and event["status"] != "running":
+                        label = STAGE_LABELS.get(event["stage"], event["stage"])
+                        st.write(f"{label}: {event['status']} ({event['elapsed']:.1f}s)")
+                    elif event["type"] == "delta" and event["stage"] == "plan":
+                        plan_chars += len(event["text"])
+                        plan_progress.caption(f"🧠 正在生成行程... 已生成 {plan_chars} 字")
+                    elif event["type"] == "plan_day":
+                        # 行程逐天生成完毕即渲染
+                        days_stream += render_day_markdown(event["day"])
+                        message_placeholder.markdown(days_stream)
+                    elif event["type"] == "delta" and event["stage"] == "writer":
+                        guide_stream += event["text"]
+                        message_placeholder.markdown(days_stream + "---\n" + guide_stream + "▌")
+                    elif event["type"] == "result":
+                        plan_json = event["plan"]
+            except Exception as e:
+                st.error(f"Execution Error: {e}")
+                plan_json = {}
             
-            # 显示捕获的日志
-            logs = f.getvalue()
-            st.code(logs, language="text")
+            # 显示本次运行的日志
+            st.code("\n".join(log_lines), language="text")
             
             if not plan_json:
+                del st.query_params["job"]
                 st.error("生成失败，请检查上方日志。")
                 st.stop()
                 
@@ -110,6 +187,9 @@ if prompt := st.chat_input("输入目的地和天数..."):
                 for note in plan_json["_raw_notes"]:
                     st.markdown(f"**[{note.get('author', 'Unknown')}]** {note.get('title')}")
                     st.caption(note.get('content')[:100] + "...")
+                    if note.get("duplicates"):
+                        sources = "、".join(sorted({d["source"] for d in note["duplicates"]}))
+                        st.caption(f"🔁 另有 {len(note['duplicates'])} 篇相似内容已合并 (来源: {sources})")
                     st.markdown("---")
         
         # 动态生成回复
@@ -118,17 +198,7 @@ if prompt := st.chat_input("输入目的地和天数..."):
         detailed_guide = plan_json.get("detailed_guide", "")
         
         for day in plan_json.get("itinerary", []):
-            itinerary_md += f"#### 📅 第{day.get('day')}天：{day.get('date', '')}\n"
-            
-            # 显示住宿
-            acc = day.get("accommodation", {})
-            if acc:
-                itinerary_md += f"> 🏨 **住宿**: {acc.get('name')} (💰{acc.get('cost', 0)}) - _{acc.get('reason')}_\n\n"
-                
-            for act in day.get("activities", []):
-                cost = act.get("cost", 0)
-                itinerary_md += f"*   **{act.get('time')}** {act.get('name')} ({act.get('type')}) - 💰{cost}\n    *   _{act.get('description')}_\n"
-            itinerary_md += "\n"
+            itinerary_md += render_day_markdown(day)
 
         response_content = f"""
 ### 🗺️ {dest} 旅行计划 ({mode.split(' ')[0]})
@@ -144,6 +214,13 @@ if prompt := st.chat_input("输入目的地和天数..."):
         st.session_state.messages.append({"role": "assistant", "content": response_content})
         st.session_state.plan_generated = True
         st.session_state.current_plan = plan_json # 保存到 Session 以便绘图使用
+        # 路线图已在 Pipeline 中与写作并行生成；失败时由下方重新绘制
+        if plan_json.get("map_code"):
+            st.session_state.map_code = plan_json["map_code"]
+        else:
+            st.session_state.pop("map_code", None)
+        # 任务结果已保存到 Session，不再跟踪
+        del st.query_params["job"]
 
 # 额外展示区 (图表/图片)
 if st.session_state.plan_generated and "current_plan" in st.session_state:
@@ -210,6 +287,23 @@ if st.session_state.plan_generated and "current_plan" in st.session_state:
         budget_data = {"类别": list(categories.keys()), "金额": list(categories.values())}
         st.bar_chart(budget_data, x="类别", y="金额")
 
+    # --- 知识图谱构建状态 (后台入库) ---
+    kg_job_id = plan.get("kg_job_id")
+    if kg_job_id:
+        from src.services.graph_ingestion import graph_ingestion_queue
+        kg_status = graph_ingestion_queue.status(kg_job_id)
+        if kg_status is None:
+            st.caption("🕸️ 知识图谱: 任务记录已过期")
+        elif kg_status["status"] == "done":
+            report = kg_status["report"] or {}
+            skipped = report.get("skipped_docs", 0)
+            st.caption(f"🕸️ 知识图谱已就绪: {report.get('total_nodes', 0)} 个节点 ({kg_status['doc_count']} 篇文档"
+                       + (f"，其中 {skipped} 篇此前已入库" if skipped else "") + ")")
+        elif kg_status["status"] == "failed":
+            st.caption(f"🕸️ 知识图谱构建失败: {kg_status['error']}")
+        else:
+            st.caption(f"🕸️ 知识图谱后台构建中 ({kg_status['status']})...")
+
     # --- Section 2: 路线导览 (全宽) ---
     st.divider()
     st.subheader("🗺️ 路线导览 (Graphviz)")
@@ -0,0 +1,208 @@
+"""
+全流程离线基准测试
+
+使用本地替身服务 (LLM / MCP / DeepSearch) 与内存图谱驱动 AgentManager.run_flow，
+报告吞吐量、各阶段 p50/p95/p99 与峰值 RSS，可与基线结果对比。
+
+用法:
+    python -m src.bench.run_benchmark --runs 20 --concurrency 4 --out data/bench/latest.json
+    python -m src.bench.run_benchmark --baseline data/bench/baseline.json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.config import Config
+from src.bench.stubs import StubConfig, StubLatency, StubServer
+
+DESTINATIONS = ["西安", "香港", "成都", "北京", "上海", "杭州"]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩 (nearest-rank) 百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.4999)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict]:
+    return {
+        name: {
+            "n": len(values),
+            "p50": round(percentile(values, 50), 4),
+            "p95": round(percentile(values, 95), 4),
+            "p99": round(percentile(values, 99), 4),
+            "max": round(max(values), 4),
+        }
+        for name, values in sorted(samples.items()) if values
+    }
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(rss / 1024.0 / (1024.0 if sys.platform == "darwin" else 1.0), 1)
+
+
+def configure(stub: StubServer, workdir: str, graph_latency: float):
+    """将所有外部依赖指向替身服务"""
+    Config.OPENAI_API_KEY = "bench"
+    Config.OPENAI_BASE_URL = f"{stub.base_url}/v1"
+    Config.MCP_XHS_ENDPOINT = f"{stub.base_url}/mcp"
+    Config.DEEPSEARCH_API_KEY = "bench"
+    Config.DEEPSEARCH_ENDPOINT = f"{stub.base_url}/tavily/search"
+    Config.DEEPSEARCH_HEDGE = "off"  # 不对冲到真实的 DuckDuckGo
+    Config.GEMINI_API_KEY = None
+    Config.GRAPH_BACKEND = "memory"
+    Config.LLM_CACHE_ENABLED = False
+    Config.RETRIEVAL_CACHE_ENABLED = False
+    Config.EXPORTS_DIR = os.path.join(workdir, "exports")
+    Config.XHS_MD_DIR = os.path.join(workdir, "xhs_md")
+    Config.TRACE_FILE = os.path.join(workdir, "traces.jsonl")
+
+    from src.services.neo4j_service import get_graph_service
+    get_graph_service().latency = graph_latency
+
+
+def load_traces(path: str) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_benchmark(runs: int, concurrency: int, stub_config: StubConfig, days: int = 3,
+                  mode: str = "特种兵模式 (高强度)", stream: bool = True, graph_latency: float = 0.0,
+                  kg_wait: float = 120.0) -> Dict:
+    from src.agents.manager import AgentManager
+    from src.services.graph_ingestion import graph_ingestion_queue
+
+    stub = StubServer(stub_config).start()
+    workdir = tempfile.mkdtemp(prefix="trlp_bench_")
+    configure(stub, workdir, graph_latency)
+    manager = AgentManager()
+
+    def one(i: int) -> Dict:
+        user_input = f"{DESTINATIONS[i % len(DESTINATIONS)]} {days}天"
+        started = time.time()
+        first_content = None
+        plan = {}
+        if stream:
+            for event in manager.run_flow_stream(user_input, mode):
+                if first_content is None and event["type"] in ("plan_day", "delta"):
+                    first_content = time.time() - started
+                if event["type"] == "result":
+                    plan = event["plan"]
+        else:
+            plan = manager.run_flow(user_input, mode)
+        return {"ok": bool(plan), "latency": time.time() - started,
+                "first_content": first_content, "kg_job_id": plan.get("kg_job_id")}
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(runs)))
+    elapsed = time.time() - started
+
+    # 等待后台图谱入库完成，统计其批次耗时
+    for r in results:
+        job = graph_ingestion_queue.get(r["kg_job_id"]) if r["kg_job_id"] else None
+        if job:
+            job.wait(kg_wait)
+
+    stages: Dict[str, List[float]] = {}
+    llm_tokens = {"prompt": 0, "completion": 0}
+    for trace in load_traces(Config.TRACE_FILE):
+        for name, stage in trace["stages"].items():
+            key = "kg_batch" if name.startswith("kg_batch_") else name
+            stages.setdefault(key, []).append(stage["elapsed"])
+        if trace["kind"] == "kg_ingestion":
+            stages.setdefault("kg_ingestion", []).append(trace["wall_time"])
+        llm_tokens["prompt"] += trace["llm"]["prompt_tokens"]
+        llm_tokens["completion"] += trace["llm"]["completion_tokens"]
+
+    stages["run_flow"] = [r["latency"] for r in results]
+    stages["time_to_first_content"] = [r["first_content"] for r in results if r["first_content"] is not None]
+
+    stub.stop()
+    return {
+        "runs": runs,
+        "concurrency": concurrency,
+        "succeeded": sum(1 for r in results if r["ok"]),
+        "elapsed": round(elapsed, 3),
+        "throughput_rps": round(runs / elapsed, 4) if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "llm_tokens": llm_tokens,
+        "stub_requests": dict(stub.requests),
+        "stages": summarize(stages),
+    }
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    """与基线逐阶段对比 p95"""
+    lines = [f"throughput: {baseline['throughput_rps']} -> {current['throughput_rps']} rps"]
+    for name, stat in current["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base or not base["p95"]:
+            continue
+        delta = (stat["p95"] - base["p95"]) / base["p95"] * 100
+        lines.append(f"{name:<24} p95 {base['p95']:.3f}s -> {stat['p95']:.3f}s ({delta:+.1f}%)")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TRLP offline pipeline benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="LLM 首 token 延迟均值 (秒)")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.01, help="流式输出每块间隔 (秒)")
+    parser.add_argument("--mcp-latency", type=float, default=0.3)
+    parser.add_argument("--search-latency", type=float, default=0.5)
+    parser.add_argument("--graph-latency", type=float, default=0.002, help="内存图谱每次往返的模拟延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="各延迟的抖动比例")
+    parser.add_argument("--no-stream", action="store_true", help="使用 run_flow 而非 run_flow_stream")
+    parser.add_argument("--out", help="结果 JSON 输出路径")
+    parser.add_argument("--baseline", help="基线结果 JSON，用于对比")
+    args = parser.parse_args(argv)
+
+    def latency(mean):
+        return StubLatency(mean, mean * args.jitter)
+
+    stub_config = StubConfig(llm=latency(args.llm_latency), llm_chunk_delay=args.llm_chunk_delay,
+                             mcp=latency(args.mcp_latency), search=latency(args.search_latency),
+                             days=args.days)
+    report = run_benchmark(args.runs, args.concurrency, stub_config, days=args.days,
+                           stream=not args.no_stream, graph_latency=args.graph_latency)
+
+    print("\n===== Benchmark =====")
+    print(f"runs={report['runs']} concurrency={report['concurrency']} succeeded={report['succeeded']} "
+          f"elapsed={report['elapsed']}s throughput={report['throughput_rps']} rps peak_rss={report['peak_rss_mb']}MB")
+    print(f"{'stage':<24}{'n':>5}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stat in report["stages"].items():
+        print(f"{name:<24}{stat['n']:>5}{stat['p50']:>10.3f}{stat['p95']:>10.3f}{stat['p99']:>10.3f}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print("\n===== vs baseline =====")
+            print("\n".join(compare(report, json.load(f))))
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved to {args.out}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+离线基准测试用的本地替身服务
+
+单个 HTTP 服务器同时提供：
+- POST /v1/chat/completions : OpenAI 兼容接口 (支持 stream + usage)，按 system prompt 返回预置输出
+- POST /mcp/search          : 小红书 MCP Server 的 /search 路由
+- POST /tavily/search       : DeepSearch (Tavily) 替身
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from src.utils.context_packer import count_tokens
+
+SPOTS = ["兵马俑", "大雁塔", "钟楼", "鼓楼", "回民街", "城墙", "陕西历史博物馆", "大唐不夜城",
+         "华清宫", "小雁塔", "永兴坊", "书院门", "曲江池", "碑林", "西安博物院"]
+FOODS = ["肉夹馍", "羊肉泡馍", "biangbiang面", "凉皮", "甑糕", "胡辣汤", "灌汤包", "油泼面"]
+
+
+class StubLatency:
+    """延迟配置：均值 ± 抖动 (秒)"""
+
+    def __init__(self, mean: float = 0.0, jitter: float = 0.0):
+        self.mean = mean
+        self.jitter = jitter
+
+    def sample(self) -> float:
+        return max(0.0, self.mean + random.uniform(-self.jitter, self.jitter))
+
+
+class StubConfig:
+    def __init__(self, llm: StubLatency = None, llm_chunk_delay: float = 0.01,
+                 mcp: StubLatency = None, search: StubLatency = None,
+                 notes_per_query: int = 30, days: int = 3, seed: int = 42, repost_ratio: float = 0.2):
+        self.llm = llm or StubLatency(1.0, 0.2)
+        self.llm_chunk_delay = llm_chunk_delay
+        self.mcp = mcp or StubLatency(0.3, 0.1)
+        self.search = search or StubLatency(0.5, 0.2)
+        self.notes_per_query = notes_per_query
+        self.days = days
+        self.seed = seed
+        self.repost_ratio = repost_ratio  # 搬运/转载笔记的比例 (内容与前面某篇几乎相同)
+
+
+def canned_plan(destination: str, days: int) -> Dict:
+    itinerary = []
+    for d in range(1, days + 1):
+        activities = []
+        for k, hour in enumerate((8, 10, 12, 15, 18, 20)):
+            is_food = k in (2, 4)
+            activities.append({
+                "time": f"{hour:02d}:00",
+                "type": "food" if is_food else "spot",
+                "name": FOODS[(d + k) % len(FOODS)] if is_food else SPOTS[(d * 3 + k) % len(SPOTS)],
+                "description": "必去理由：历史地位突出；交通：地铁直达约30分钟；提示：提前预约。",
+                "cost": 30 if is_food else 80,
+                "source_id": f"note_{d}_{k}",
+                "tips": "避开节假日高峰",
+            })
+        itinerary.append({
+            "day": d,
+            "date": f"Day {d}",
+            "accommodation": {"name": "钟楼附近酒店", "cost": 300, "reason": "交通便利"},
+            "activities": activities,
+        })
+    return {"destination": destination, "duration_days": days, "mode": "bench",
+            "total_budget_estimate": 0, "itinerary": itinerary}
+
+
+def canned_kg(text: str) -> Dict:
+    names = [s for s in SPOTS if s in text] or SPOTS[:3]
+    nodes = [{"id": n, "type": "Place", "properties": {"name": n, "type": "spot"}} for n in names]
+    nodes += [{"id": f, "type": "Food", "properties": {"name": f}} for f in FOODS[:2]]
+    rels = [{"source": n, "source_type": "Place", "target": FOODS[i % 2], "target_type": "Food", "type": "OFFERS"}
+            for i, n in enumerate(names)]
+    rels += [{"source": a, "source_type": "Place", "target": b, "target_type": "Place", "type": "NEARBY"}
+             for a, b in zip(names, names[1:])]
+    return {"nodes": nodes, "relationships": rels}
+
+
+def canned_guide(destination: str) -> str:
+    section = f"## {destination} 每日深度复盘\n\n" + "".join(
+        f"- **{s}**：清晨的光线穿过城墙垛口，这是感受{destination}气质的最佳时刻。\n" for s in SPOTS)
+    return f"# {destination} 深度城市指南\n\n" + section * 4
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload: Dict, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.count(self.path)
+        payload = self._read_json()
+        if self.path.endswith("/chat/completions"):
+            self._chat(payload)
+        elif self.path == "/mcp/search":
+            time.sleep(self.server.config.mcp.sample())
+            self._send_json({"data": self.server.notes(payload.get("keyword", ""), payload.get("count", 10),
+                                                       payload.get("page", 1))})
+        elif self.path == "/tavily/search":
+            time.sleep(self.server.config.search.sample())
+            self._send_json({"results": self.server.web_results(payload.get("query", ""), payload.get("max_results", 5))})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _chat(self, payload: Dict):
+        messages = payload.get("messages", [])
+        system = messages[0]["content"] if messages else ""
+        user = messages[-1]["content"] if messages else ""
+        content = self.server.completion(system, user)
+        usage = {
+            "prompt_tokens": sum(count_tokens(m.get("content", "")) for m in messages),
+            "completion_tokens": count_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        # 首 token 延迟
+        time.sleep(self.server.config.llm.sample())
+        if not payload.get("stream"):
+            self._send_json({"choices": [{"message": {"role": "assistant", "content": content}}], "usage": usage})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(data: str):
+            chunk = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n" % len(chunk) + chunk + b"\r\n")
+            self.wfile.flush()
+
+        step = 40
+        for i in range(0, len(content), step):
+            write_event(json.dumps({"choices": [{"delta": {"content": content[i:i + step]}}]}, ensure_ascii=False))
+            if self.server.config.llm_chunk_delay:
+                time.sleep(self.server.config.llm_chunk_delay)
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            write_event(json.dumps({"choices": [], "usage": usage}))
+        write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    """本地替身服务 (后台线程运行)"""
+
+    daemon_threads = True
+
+    def __init__(self, config: StubConfig = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.config = config or StubConfig()
+        self.requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="bench-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, path: str):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def notes(self, keyword: str, count: int, page: int = 1):
+        rng = random.Random(f"{self.config.seed}:{keyword}:{page}")
+        notes = []
+        for i in range((page - 1) * count, min(page * count, self.config.notes_per_query)):
+            spots = rng.sample(SPOTS, 3)
+            food = rng.choice(FOODS)
+            content = (f"第一次来{keyword}，推荐{spots[0]}、{spots[1]}和{spots[2]}。"
+                       f"{spots[0]}门票120元，建议早上8点前到。附近的{food}人均25元，排队半小时。") * 3
+            if notes and rng.random() < self.config.repost_ratio:
+                content = rng.choice(notes)["content"] + " #转载"
+            notes.append({
+                "id": f"stub_{zlib.crc32(keyword.encode('utf-8')) % 10000}_{i}",
+                "title": f"{keyword}攻略 | {spots[0]}+{spots[1]}一日游",
+                "content": content,
+                "author": f"user_{i}",
+                "url": f"https://www.xiaohongshu.com/explore/stub{i}",
+                "time": "2024-05-01",
+                "liked_count": rng.randint(10, 5000),
+                "tags": [keyword, "旅行"],
+            })
+        return notes
+
+    def web_results(self, query: str, count: int):
+        return [{
+            "title": f"{query} - 攻略 {i}",
+            "content": f"{query}：{SPOTS[i % len(SPOTS)]}开放时间 8:30-17:30，门票 {60 + i * 10} 元。",
+            "url": f"https://example.com/guide/{i}",
+        } for i in range(count)]
+
+    def completion(self, system: str, user: str) -> str:
+        if "Knowledge Graph" in system:
+            return json.dumps(canned_kg(user), ensure_ascii=False)
+        destination = (re.search(r"用户需求:\s*(\S+)", user) or re.search(r'"destination":\s*"([^"]+)"', user)
+                       or re.search(r"目的地=([^;\s]+)", user))
+        destination = destination.group(1) if destination else "西安"
+        if "规划师" in system:
+            days = re.search(r"(\d+)\s*天", user)
+            plan = canned_plan(destination, int(days.group(1)) if days else self.config.days)
+            return json.dumps(plan, ensure_ascii=False)
+        return canned_guide(destination)
@@ -11,14 +11,98 @@ class Config:
     OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     DEEPSEARCH_API_KEY = os.getenv("DEEPSEARCH_API_KEY")
+    DEEPSEARCH_ENDPOINT = os.getenv("DEEPSEARCH_ENDPOINT", "https://api.tavily.com/search")
+    # 对冲搜索: off (顺序回退) / race (取最先返回) / merge (合并去重)
+    DEEPSEARCH_HEDGE = os.getenv("DEEPSEARCH_HEDGE", "race").lower()
+    # 发起备用提供方前的等待 (秒)；auto 表示取 Tavily 近期耗时的 p90
+    DEEPSEARCH_HEDGE_DELAY = os.getenv("DEEPSEARCH_HEDGE_DELAY", "auto")
+    DEEPSEARCH_HEDGE_DEFAULT_DELAY = float(os.getenv("DEEPSEARCH_HEDGE_DEFAULT_DELAY", "1.5"))
+    DEEPSEARCH_HEDGE_TIMEOUT = float(os.getenv("DEEPSEARCH_HEDGE_TIMEOUT", "10"))
     
     # Neo4j
     NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
     NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
     NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+    GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j")  # neo4j / memory
+    NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or None  # 为空时使用服务器默认数据库
+    NEO4J_POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "50"))  # 共享 driver 的最大连接数
+    NEO4J_ACQUIRE_TIMEOUT = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", "10"))  # 连接池取连接的等待上限 (秒)
+    NEO4J_MAX_RETRY_TIME = float(os.getenv("NEO4J_MAX_RETRY_TIME", "15"))  # 托管事务重试的总时长上限 (秒)
+    NEO4J_SCHEMA_BOOTSTRAP = os.getenv("NEO4J_SCHEMA_BOOTSTRAP", "true").lower() == "true"  # 首次连接时建立唯一约束
+    NEO4J_WRITE_CHUNK_SIZE = int(os.getenv("NEO4J_WRITE_CHUNK_SIZE", "500"))  # 每条 UNWIND 语句的最大行数
     
     # MCP
     MCP_XHS_ENDPOINT = os.getenv("MCP_XHS_ENDPOINT", "http://localhost:8000")
+    # 多维度并发检索的子查询 (逗号分隔，留空则只按目的地检索一次)
+    MCP_FACETS = [f.strip() for f in os.getenv("MCP_FACETS", "景点,美食,住宿,交通").split(",") if f.strip()]
+    MCP_FANOUT_DEADLINE = float(os.getenv("MCP_FANOUT_DEADLINE", "8"))  # 所有维度的总时限 (秒)
+    MCP_PAGE_SIZE = int(os.getenv("MCP_PAGE_SIZE", "10"))
+    MCP_MAX_PAGES = int(os.getenv("MCP_MAX_PAGES", "3"))
+    
+    # HTTP Transport
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+    HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+    
+    # LLM Response Cache (opt-in)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+    LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "200"))
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+    # 温度不高于该值的调用视为确定性阶段，默认缓存
+    LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+    
+    # Retrieval Cache (小红书笔记 / 全网搜索结果)
+    RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    RETRIEVAL_CACHE_MAX_MB = int(os.getenv("RETRIEVAL_CACHE_MAX_MB", "100"))
+    RETRIEVAL_CACHE_TTL_XHS = float(os.getenv("RETRIEVAL_CACHE_TTL_XHS", str(6 * 3600)))
+    RETRIEVAL_CACHE_TTL_WEB = float(os.getenv("RETRIEVAL_CACHE_TTL_WEB", str(24 * 3600)))
+    # 过期后仍可先返回旧结果并后台刷新的时长
+    RETRIEVAL_CACHE_STALE_TTL = float(os.getenv("RETRIEVAL_CACHE_STALE_TTL", str(3 * 24 * 3600)))
+    
+    # Context Packing (token 预算)
+    CONTEXT_BUDGET_PLAN = int(os.getenv("CONTEXT_BUDGET_PLAN", "6000"))
+    # 注入图谱摘要后，规划 Prompt 中原文的 token 预算
+    CONTEXT_BUDGET_PLAN_GROUNDED = int(os.getenv("CONTEXT_BUDGET_PLAN_GROUNDED", "2000"))
+    CONTEXT_BUDGET_WRITER = int(os.getenv("CONTEXT_BUDGET_WRITER", "3000"))
+    CONTEXT_BUDGET_KG_BATCH = int(os.getenv("CONTEXT_BUDGET_KG_BATCH", "2000"))
+    CONTEXT_MAX_TOKENS_PER_DOC = int(os.getenv("CONTEXT_MAX_TOKENS_PER_DOC", "400"))
+    
+    # 写作阶段的计划编码: json (紧凑 JSON) / terse (按天分行的简写)
+    PLAN_ENCODING = os.getenv("PLAN_ENCODING", "json")
+    
+    # Telemetry
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 表示不启动 /metrics 端点
+    
+    # Record / Replay (外部 I/O 磁带)
+    CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()  # off / record / replay
+    CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0"))  # 0 表示回放时去掉延迟
+    
+    # Knowledge Graph
+    KG_BATCH_SIZE = int(os.getenv("KG_BATCH_SIZE", "5"))
+    KG_MAX_CONCURRENCY = int(os.getenv("KG_MAX_CONCURRENCY", "4"))
+    GRAPH_CONTEXT_ENABLED = os.getenv("GRAPH_CONTEXT_ENABLED", "true").lower() == "true"  # 规划时注入图谱摘要
+    GRAPH_CONTEXT_MIN_SPOTS = int(os.getenv("GRAPH_CONTEXT_MIN_SPOTS", "5"))  # 图谱地点少于该数时只用原文
+    KG_INCREMENTAL = os.getenv("KG_INCREMENTAL", "true").lower() == "true"  # false: 每次按目的地清理后全量重建
+    
+    # Near-Duplicate Detection (MinHash)
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))  # 估计 Jaccard 相似度不低于该值视为重复
+    DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "5"))  # 字符 k-gram 长度
+    DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))  # MinHash 签名长度 (需为 16 的倍数)
+    
+    # Relevance Rerank (各下游阶段取用的文档数，0 表示全部)
+    RERANK_TOP_K_PLAN = int(os.getenv("RERANK_TOP_K_PLAN", "24"))
+    RERANK_TOP_K_WRITER = int(os.getenv("RERANK_TOP_K_WRITER", "12"))
+    RERANK_TOP_K_KG = int(os.getenv("RERANK_TOP_K_KG", "0"))
+    
+    # Circuit Breaker (MCP / Neo4j / LLM)
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))  # 连续失败多少次后熔断
+    CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", "30"))  # 熔断冷却时间 (秒)，之后放行一个探测请求
+    
+    # Plan Job Queue
+    PLAN_JOB_WORKERS = int(os.getenv("PLAN_JOB_WORKERS", "4"))  # 同时执行的规划任务数
+    PLAN_JOB_MAX_QUEUED = int(os.getenv("PLAN_JOB_MAX_QUEUED", "16"))  # 排队上限，超出时拒绝新任务
     
     # System
     MOCK_MODE = False
@@ -33,6 +117,10 @@ class Config:
     MOCK_DIR = os.path.join(DATA_DIR, "mock")
     XHS_MD_DIR = os.path.join(DATA_DIR, "xhs_md")
     EXPORTS_DIR = os.path.join(DATA_DIR, "exports")
+    TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(DATA_DIR, "traces", "runs.jsonl"))
+    LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(DATA_DIR, "cache", "llm"))
+    RETRIEVAL_CACHE_DIR = os.getenv("RETRIEVAL_CACHE_DIR", os.path.join(DATA_DIR, "cache", "retrieval"))
+    CASSETTE_PATH = os.getenv("CASSETTE_PATH", os.path.join(DATA_DIR, "cassettes", "session.jsonl.gz"))
     
     @classmethod
     def validate(cls):
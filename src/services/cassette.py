@@ -0,0 +1,192 @@
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Optional
+
+from src.config import Config
+
+# 不参与匹配、也不写入磁带的敏感字段
+_REDACT_KEYS = {"api_key", "authorization", "password"}
+
+
+class CassetteMiss(LookupError):
+    """回放模式下找不到匹配的录制记录"""
+
+
+class RecordedCallError(RuntimeError):
+    """回放录制时失败的调用 (保留原始异常类型与信息)"""
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {k: ("***" if k.lower() in _REDACT_KEYS else _redact(v)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+
+class Cassette:
+    """
+    外部 I/O 录制/回放磁带
+    - record: 透传真实调用，并把 (请求, 响应, 耗时) 追加写入 gzip 压缩的 JSON Lines 文件
+    - replay: 不访问外部服务，按请求内容匹配录制记录并确定性地返回；
+              相同请求多次出现时按录制顺序依次返回
+    回放时可按原始耗时 (乘以 latency_scale) 睡眠，或设为 0 去掉延迟，以单独剖析 CPU 侧耗时。
+    """
+
+    def __init__(self, path: str, mode: str = "replay", latency_scale: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        self._entries: Dict[str, deque] = defaultdict(deque)
+        self._last: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._writer = None
+        if mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @staticmethod
+    def make_key(kind: str, request: Dict) -> str:
+        raw = json.dumps({"kind": kind, "request": _redact(request)},
+                         ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]].append(entry)
+            except (EOFError, ValueError):
+                # 录制进程未正常退出时 gzip 尾部缺失，已 flush 的记录仍然可用
+                pass
+        print(f"📼 [Cassette] Loaded {sum(len(q) for q in self._entries.values())} entries from {self.path}")
+
+    def call(self, kind: str, request: Dict, fn: Callable[[], Any],
+             encode: Callable[[Any], Any] = None, decode: Callable[[Any], Any] = None) -> Any:
+        """
+        经过磁带执行一次外部调用
+
+        Args:
+            kind: 调用类别 (http / ddgs / gemini / neo4j)
+            request: 用于匹配的请求描述 (需可 JSON 序列化)
+            fn: 真实调用
+            encode / decode: 响应与可序列化形式之间的转换
+        """
+        key = self.make_key(kind, request)
+        if self.mode == "replay":
+            return self._replay(kind, key, decode)
+
+        started = time.time()
+        entry = {"key": key, "kind": kind, "request": _redact(request), "recorded_at": round(started, 3)}
+        try:
+            result = fn()
+            entry["response"] = encode(result) if encode else result
+        except Exception as e:
+            # 失败也录制下来，回放时以同样的耗时失败 (如 MCP 超时后回退)
+            entry["error"] = f"{e.__class__.__name__}: {e}"
+            raise
+        finally:
+            entry["latency"] = round(time.time() - started, 4)
+            self._append(entry)
+        return result
+
+    def _append(self, entry: Dict):
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._writer is None:
+                # 整个会话共用一个 gzip 流以获得更好的压缩率；每条记录后 flush，进程退出时关闭
+                self._writer = gzip.open(self.path, "at", encoding="utf-8")
+                atexit.register(self.close)
+            self._writer.write(line + "\n")
+            self._writer.flush()
+            self.stats["recorded"] += 1
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def _replay(self, kind: str, key: str, decode: Callable[[Any], Any] = None) -> Any:
+        with self._lock:
+            queue = self._entries.get(key)
+            if queue:
+                entry = queue.popleft()
+                self._last[key] = entry
+            else:
+                entry = self._last.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"No recorded {kind} call matches this request")
+            self.stats["replayed"] += 1
+        if self.latency_scale:
+            time.sleep(entry["latency"] * self.latency_scale)
+        if "error" in entry:
+            raise RecordedCallError(entry["error"])
+        response = entry["response"]
+        return decode(response) if decode else response
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """按 CASSETTE_MODE 返回共享磁带；off 时返回 None"""
+    global _cassette
+    if Config.CASSETTE_MODE not in ("record", "replay"):
+        return None
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette(Config.CASSETTE_PATH, Config.CASSETTE_MODE, Config.CASSETTE_LATENCY_SCALE)
+    return _cassette
+
+
+def cassette_call(kind: str, request: Dict, fn: Callable[[], Any],
+                  encode: Callable[[Any], Any] = None, decode: Callable[[Any], Any] = None) -> Any:
+    """磁带关闭时直接执行 fn，否则经由磁带录制或回放"""
+    cassette = get_cassette()
+    if cassette is None:
+        return fn()
+    return cassette.call(kind, request, fn, encode, decode)
+
+
+def encode_response(resp) -> Dict:
+    """requests.Response -> 可序列化字典 (会读取完整响应体)"""
+    data = {"status": resp.status_code, "headers": dict(resp.headers), "url": resp.url}
+    try:
+        data["text"] = resp.content.decode("utf-8")
+    except UnicodeDecodeError:
+        data["body"] = base64.b64encode(resp.content).decode("ascii")
+    return data
+
+
+def decode_response(data: Dict):
+    """可序列化字典 -> requests.Response (响应体已就绪，支持 json()/iter_lines())"""
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    resp = requests.Response()
+    resp.status_code = data["status"]
+    resp.headers = CaseInsensitiveDict(data.get("headers") or {})
+    resp.url = data.get("url", "")
+    resp._content = data["text"].encode("utf-8") if "text" in data else base64.b64decode(data["body"])
+    resp._content_consumed = True
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers) or "utf-8"
+    return resp
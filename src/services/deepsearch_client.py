@@ -1,5 +1,47 @@
-import requests
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
 from src.config import Config
+from src.services.http_client import get_transport
+from src.utils.telemetry import track_external
+from src.services.cassette import cassette_call
+from src.services.retrieval_cache import cached_retrieval
+
+def ddgs_text_search(query: str, max_results: int, op: str = "search") -> list:
+    """DuckDuckGo 文本搜索 (开启 CASSETTE_MODE 时经由磁带录制/回放)"""
+    def search():
+        from duckduckgo_search import DDGS
+        with track_external("ddgs", op), DDGS() as ddgs:
+            # DDGS 返回 generator
+            return list(ddgs.text(query, max_results=max_results))
+    
+    return cassette_call("ddgs", {"query": query, "max_results": max_results}, search)
+
+class LatencyWindow:
+    """最近 N 次调用的耗时窗口，用于估计分位数"""
+
+    def __init__(self, size: int = 50):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def quantile(self, q: float, default: float, min_samples: int = 5) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return default
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+# 各提供方的近期耗时 (驱动自适应对冲延迟) 与对冲线程池 (进程内共享)
+_provider_latency = {"tavily": LatencyWindow(), "ddgs": LatencyWindow()}
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="deepsearch-hedge")
 
 class DeepSearchClient:
     """
@@ -9,7 +51,7 @@ class DeepSearchClient:
     def __init__(self):
         self.api_key = Config.DEEPSEARCH_API_KEY
         # 假设使用 Tavily 或类似服务作为 DeepSearch
-        self.endpoint = "https://api.tavily.com/search" 
+        self.endpoint = Config.DEEPSEARCH_ENDPOINT
         
     def search(self, query: str, max_results: int = 5):
         """
@@ -17,40 +59,9 @@ class DeepSearchClient:
         """
         print(f"🔍 [DeepSearch] Searching for: {query} (Limit: {max_results})")
         
-        results = []
-        
-        # 1. 优先尝试真实 Key (Tavily/DeepSearch)
-        if self.api_key and "sk-" not in self.api_key:
-             try:
-                payload = {"query": query, "api_key": self.api_key, "search_depth": "basic", "max_results": max_results}
-                response = requests.post(self.endpoint, json=payload, timeout=5)
-                if response.status_code == 200:
-                    data = response.json().get("results", [])
-                    for r in data:
-                        results.append({
-                            "title": r.get("title"),
-                            "content": r.get("content"),
-                            "url": r.get("url")
-                        })
-             except Exception as e:
-                 print(f"DeepSearch API Error: {e}")
+        results = cached_retrieval("web", query, lambda: self._search_results(query, max_results),
+                                   params={"max_results": max_results})
         
-        # 2. Fallback: 使用 DuckDuckGo (真实网络搜索)
-        if not results:
-            try:
-                from duckduckgo_search import DDGS
-                with DDGS() as ddgs:
-                    # DDGS 返回 generator
-                    ddgs_gen = ddgs.text(query, max_results=max_results)
-                    for r in ddgs_gen:
-                        results.append({
-                            "title": r.get("title"),
-                            "content": r.get("body"),
-                            "url": r.get("href")
-                        })
-            except Exception as e:
-                print(f"DDGS Error: {e}")
-
         # 3. 如果还是没有，使用 Mock
         if not results:
             print("DeepSearch Error: No results returned from API/DDGS.")
@@ -60,10 +71,123 @@ class DeepSearchClient:
         formatted = "\n".join([f"- [{r['title']}]({r['url']}): {r['content']}" for r in results])
         return formatted, results
 
-    def _fallback_search(self, query):
-        return f"""
-        [DeepSearch 模拟结果] 关于 {query} 的网络搜索：
-        1. 携程攻略: {query} 建议游玩时间为3-4天，必去景点包括...
-        2. 马蜂窝: {query} 当地特色美食推荐...
-        3. 维基百科: {query} 的历史文化背景...
+    def _search_results(self, query: str, max_results: int) -> list:
+        """
+        返回原始结果列表
+        DEEPSEARCH_HEDGE=off 时依次尝试 Tavily 与 DDGS；否则对冲执行 (见 _hedged_search)
+        """
+        providers = []
+        # 1. 优先尝试真实 Key (Tavily/DeepSearch)
+        if self.api_key and "sk-" not in self.api_key:
+            providers.append(("tavily", self._search_tavily))
+        # 2. Fallback: 使用 DuckDuckGo (真实网络搜索)
+        providers.append(("ddgs", self._search_ddgs))
+        
+        if Config.DEEPSEARCH_HEDGE == "off" or len(providers) == 1:
+            for name, search in providers:
+                results = self._timed(name, search, query, max_results)
+                if results:
+                    return results
+            return []
+        return self._hedged_search(providers, query, max_results)
+
+    def _hedged_search(self, providers: list, query: str, max_results: int) -> list:
         """
+        对冲搜索：先发起主提供方，超过对冲延迟仍未返回有效结果时再发起备用提供方
+        - race: 取最先返回的非空结果，取消 (或放弃) 另一方
+        - merge: 等待双方 (受 DEEPSEARCH_HEDGE_TIMEOUT 约束)，按 URL 去重后合并
+        """
+        merge = Config.DEEPSEARCH_HEDGE == "merge"
+        started = time.time()
+        deadline = started + Config.DEEPSEARCH_HEDGE_TIMEOUT
+        (primary_name, _), (secondary_name, _) = providers[0], providers[1]
+        delay = self._hedge_delay(primary_name)
+        
+        def start(name, search) -> Future:
+            ctx = contextvars.copy_context()
+            return _hedge_pool.submit(ctx.run, self._timed, name, search, query, max_results)
+        
+        pending = {start(*providers[0]): primary_name}
+        collected = {}
+        hedged = False
+        while pending:
+            timeout = max(0.0, deadline - time.time())
+            if not hedged:
+                timeout = min(timeout, delay)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                results = future.result()
+                if results:
+                    collected[name] = results
+            
+            if collected and not merge:
+                break
+            if not hedged:
+                # 主提供方超过对冲延迟、失败或返回空结果 (merge 模式下无论如何) ：发起备用提供方
+                hedged = True
+                print(f"🔀 [DeepSearch] Hedging to {secondary_name} after {time.time() - started:.2f}s")
+                pending[start(*providers[1])] = secondary_name
+                continue
+            if time.time() >= deadline:
+                break
+        
+        for future in pending:
+            # 尚未开始的直接取消；已在进行中的请求无法中断，其结果被丢弃
+            future.cancel()
+        
+        if not merge:
+            for name, _ in providers:
+                if name in collected:
+                    print(f"🔀 [DeepSearch] Using {name} results")
+                    return collected[name]
+            return []
+        
+        merged, seen = [], set()
+        for name, _ in providers:
+            for r in collected.get(name, []):
+                url = (r.get("url") or "").rstrip("/")
+                if url in seen:
+                    continue
+                seen.add(url)
+                merged.append(r)
+        return merged[:max_results]
+
+    def _hedge_delay(self, provider: str) -> float:
+        """固定延迟，或 auto：取主提供方近期耗时的 p90 (样本不足时用默认值)"""
+        if Config.DEEPSEARCH_HEDGE_DELAY != "auto":
+            return float(Config.DEEPSEARCH_HEDGE_DELAY)
+        return _provider_latency[provider].quantile(0.9, default=Config.DEEPSEARCH_HEDGE_DEFAULT_DELAY)
+
+    def _timed(self, name: str, search, query: str, max_results: int) -> list:
+        """执行单个提供方并记录耗时 (失败返回空列表)"""
+        started = time.time()
+        try:
+            return search(query, max_results)
+        except Exception as e:
+            print(f"DeepSearch {name} Error: {e}")
+            return []
+        finally:
+            _provider_latency[name].add(time.time() - started)
+
+    def _search_tavily(self, query: str, max_results: int) -> list:
+        payload = {"query": query, "api_key": self.api_key, "search_depth": "basic", "max_results": max_results}
+        # 对冲模式下备用源即是重试，Tavily 只发一次，避免被放弃的调用长期占用 _hedge_pool
+        hedged = Config.DEEPSEARCH_HEDGE != "off"
+        with track_external("tavily", "search"):
+            response = get_transport().post(self.endpoint, json=payload, timeout=(3, 5),
+                                            retries=0 if hedged else 1, retry_read_timeout=not hedged)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return [{
+            "title": r.get("title"),
+            "content": r.get("content"),
+            "url": r.get("url")
+        } for r in response.json().get("results", [])]
+
+    def _search_ddgs(self, query: str, max_results: int) -> list:
+        return [{
+            "title": r.get("title"),
+            "content": r.get("body"),
+            "url": r.get("href")
+        } for r in ddgs_text_search(query, max_results, op="search")]
@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, Optional
+
+
+class GraphIngestionJob:
+    """
+    图谱入库任务句柄
+    提供状态查询与完成等待，供 UI 或后续流程在图谱就绪后使用。
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, destination: str, doc_count: int, build_fn: Callable[[], dict]):
+        self.id = uuid.uuid4().hex[:12]
+        self.destination = destination
+        self.doc_count = doc_count
+        self.status = self.QUEUED
+        self.report: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._build_fn = build_fn
+        self._done = threading.Event()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """阻塞直到任务结束，返回是否已结束"""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "destination": self.destination,
+            "doc_count": self.doc_count,
+            "status": self.status,
+            "report": self.report,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class GraphIngestionQueue:
+    """
+    后台图谱入库队列
+    单个后台线程按提交顺序执行入库任务，使知识图谱构建不再阻塞规划主流程。
+    任务串行执行，因此不同任务之间的清库/写入不会互相交错。
+    """
+
+    def __init__(self, max_history: int = 50):
+        self.max_history = max_history
+        self._queue: "queue.Queue[GraphIngestionJob]" = queue.Queue()
+        self._jobs: Dict[str, GraphIngestionJob] = {}
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, destination: str, doc_count: int, build_fn: Callable[[], dict]) -> GraphIngestionJob:
+        """
+        提交入库任务
+
+        Args:
+            destination: 目的地 (仅用于展示)
+            doc_count: 文档数量 (仅用于展示)
+            build_fn: 实际执行构建的函数，返回构建报告
+        """
+        job = GraphIngestionJob(destination, doc_count, build_fn)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim_history()
+            self._ensure_worker()
+        self._queue.put(job)
+        print(f"🕸️ [GraphIngestion] Job {job.id} queued ({doc_count} docs, {destination}).")
+        return job
+
+    def get(self, job_id: str) -> Optional[GraphIngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        job = self.get(job_id)
+        return job.to_dict() if job else None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="graph-ingestion", daemon=True)
+            self._worker.start()
+
+    def _trim_history(self):
+        finished = [j for j in self._jobs.values() if j.done()]
+        overflow = len(self._jobs) - self.max_history
+        for job in sorted(finished, key=lambda j: j.submitted_at)[:max(0, overflow)]:
+            del self._jobs[job.id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.status = GraphIngestionJob.RUNNING
+            job.started_at = time.time()
+            try:
+                job.report = job._build_fn()
+                job.status = GraphIngestionJob.DONE
+            except Exception as e:
+                job.error = str(e)
+                job.status = GraphIngestionJob.FAILED
+                print(f"[Warning] Graph ingestion job {job.id} failed: {e}")
+                traceback.print_exc()
+            finally:
+                job.finished_at = time.time()
+                job._build_fn = None
+                job._done.set()
+                self._queue.task_done()
+            print(f"🕸️ [GraphIngestion] Job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s.")
+
+
+# 单例
+graph_ingestion_queue = GraphIngestionQueue()
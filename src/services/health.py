@@ -0,0 +1,140 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from src.config import Config
+from src.utils.telemetry import metrics
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断中：后端在冷却期内被直接跳过"""
+
+
+class CircuitBreaker:
+    """
+    单个后端的熔断器
+    - closed: 正常放行；连续失败 failure_threshold 次后进入 open
+    - open: 冷却期 (cooldown 秒) 内直接拒绝，不再等待超时
+    - half_open: 冷却期结束后只放行一个探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = None, cooldown: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.cooldown = Config.CIRCUIT_COOLDOWN if cooldown is None else cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[float] = None
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否放行本次请求 (half_open 时只放行一个探测)"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at < self.cooldown:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self.last_success_at = time.time()
+            if self.state != self.CLOSED:
+                print(f"✅ [Health] {self.name} recovered, circuit closed.")
+                self._set_state(self.CLOSED)
+
+    def record_failure(self, error: Exception = None):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if error is not None:
+                self.last_error = f"{error.__class__.__name__}: {error}"[:200]
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"⛔ [Health] {self.name} circuit open for {self.cooldown:.0f}s "
+                          f"after {self.failures} failures ({self.last_error}).")
+                self.opened_at = time.time()
+                self._set_state(self.OPEN)
+
+    def release(self):
+        """调用被中断 (未记录成败) 时释放探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.set_gauge(f"circuit_state_{self.name}", {self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[state])
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.cooldown - (time.time() - self.opened_at))
+            return {
+                "name": self.name,
+                "state": self.state,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "last_success_at": self.last_success_at,
+                "retry_in": retry_in,
+            }
+
+
+class HealthRegistry:
+    """进程内共享的后端健康登记表 (mcp / neo4j / llm ...)"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name)
+            return self._breakers[name]
+
+    @contextmanager
+    def guard(self, name: str, is_failure: Callable[[Exception], bool] = None):
+        """
+        经由熔断器执行一次后端调用
+        熔断中抛出 CircuitOpenError；调用抛出的异常默认计为失败，
+        is_failure 返回 False 的异常 (如 4xx 参数错误) 不影响熔断状态。
+        """
+        breaker = self.get(name)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{name} circuit is open, skipping")
+        try:
+            yield breaker
+        except Exception as e:
+            if is_failure is None or is_failure(e):
+                breaker.record_failure(e)
+            else:
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {b.name: b.snapshot() for b in breakers}
+
+
+# 单例
+health_registry = HealthRegistry()
@@ -0,0 +1,138 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.config import Config
+from src.services.cassette import cassette_call, encode_response, decode_response
+
+Timeout = Union[float, Tuple[float, float]]
+
+# 可重试的状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HTTPTransport:
+    """
+    共享 HTTP 传输层
+    - Keep-Alive 连接池 (requests.Session + HTTPAdapter)
+    - 对 429/5xx 与连接错误进行有限次重试，指数退避 + 全抖动，并遵循 Retry-After
+    - 读取超时默认不重试：请求可能已被服务端处理 (如计费的 LLM 调用)，幂等请求可按次开启
+    - 连接超时与读取超时分离
+    - 提供基于线程池的 async 版本
+    """
+
+    def __init__(self, pool_size: int = None, max_retries: int = None,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, max_retry_after: float = 60.0,
+                 connect_timeout: float = None, read_timeout: float = None):
+        self.pool_size = pool_size or Config.HTTP_POOL_SIZE
+        self.max_retries = Config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.connect_timeout = connect_timeout or Config.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or Config.HTTP_READ_TIMEOUT
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, url: str, timeout: Timeout = None, retries: int = None,
+                retry_read_timeout: bool = False, **kwargs) -> requests.Response:
+        """
+        发送请求 (开启 CASSETTE_MODE 时经由磁带录制/回放)
+
+        Args:
+            timeout: 单个数值或 (connect, read)，默认使用实例配置
+            retries: 覆盖默认重试次数 (0 表示不重试)
+            retry_read_timeout: 读取超时是否也重试 (仅用于幂等请求)
+
+        Returns:
+            最后一次的 Response；调用方自行 raise_for_status()
+        """
+        request = {"method": method, "url": url, "json": kwargs.get("json"), "params": kwargs.get("params")}
+        return cassette_call("http", request, lambda: self._request(method, url, timeout, retries, retry_read_timeout, **kwargs),
+                             encode=encode_response, decode=decode_response)
+
+    def _request(self, method: str, url: str, timeout: Timeout = None, retries: int = None,
+                 retry_read_timeout: bool = False, **kwargs) -> requests.Response:
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        retries = self.max_retries if retries is None else retries
+
+        attempt = 0
+        while True:
+            try:
+                resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # ConnectTimeout 同时属于 ConnectionError；ReadTimeout 说明请求已发出
+                read_timeout = not isinstance(e, requests.ConnectionError)
+                if attempt >= retries or (read_timeout and not retry_read_timeout):
+                    raise
+                delay = self._backoff(attempt)
+                print(f"⚠️ [HTTP] {method} {url} failed ({e.__class__.__name__}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            else:
+                if resp.status_code not in RETRY_STATUS or attempt >= retries:
+                    return resp
+                delay = self._retry_after(resp)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                print(f"⚠️ [HTTP] {method} {url} -> {resp.status_code}, retry {attempt + 1}/{retries} in {delay:.1f}s")
+                resp.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    async def arequest(self, method: str, url: str, **kwargs) -> requests.Response:
+        """async 版本：在默认线程池中执行，复用同一个连接池"""
+        return await asyncio.to_thread(self.request, method, url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> requests.Response:
+        return await self.arequest("POST", url, **kwargs)
+
+    async def aget(self, url: str, **kwargs) -> requests.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after(self, resp: requests.Response) -> Optional[float]:
+        value = resp.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(self.max_retry_after, max(0.0, seconds))
+
+
+_transport: Optional[HTTPTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """获取进程内共享的 HTTPTransport (懒加载)"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HTTPTransport()
+    return _transport
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.config import Config
+
+
+class LLMCache:
+    """
+    LLM 响应磁盘缓存 (内容寻址)
+    以 (model, messages, temperature) 的哈希作为 Key，每条记录一个 JSON 文件。
+    - TTL 过期：读取时判定，过期即删除
+    - 容量淘汰：超过 max_bytes 时按最近访问时间 (mtime) 淘汰最旧记录
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None, ttl: float = None):
+        self.cache_dir = cache_dir or Config.LLM_CACHE_DIR
+        self.max_bytes = max_bytes or Config.LLM_CACHE_MAX_MB * 1024 * 1024
+        self.ttl = Config.LLM_CACHE_TTL if ttl is None else ttl
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._size = None  # 懒统计的磁盘占用
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict], temperature: float) -> str:
+        raw = json.dumps({"model": model, "messages": messages, "temperature": temperature},
+                         ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+
+        if self.ttl and time.time() - entry.get("created_at", 0) > self.ttl:
+            self._remove(path)
+            self._count("misses")
+            return None
+
+        try:
+            os.utime(path)  # 刷新访问时间，用于 LRU 淘汰
+        except OSError:
+            pass
+        self._count("hits")
+        return entry.get("response")
+
+    def put(self, key: str, response: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created_at": time.time(), "response": response}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.stats["writes"] += 1
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+            if self._size is None or self._size > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._entries():
+                self._remove(path)
+            self._size = 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, size_bytes=self._size)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _evict(self):
+        """按 mtime 从旧到新淘汰，直到占用降到上限的 90% 以下 (需持有锁)"""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        now = time.time()
+        for path, size, mtime in entries:
+            expired = self.ttl and now - mtime > self.ttl
+            if total <= target and not expired:
+                continue
+            self._remove(path)
+            total -= size
+            self.stats["evictions"] += 1
+        self._size = total
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """获取共享缓存实例；未开启 LLM_CACHE_ENABLED 时返回 None"""
+    global _cache
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
@@ -1,9 +1,22 @@
 import os
 import json
+import math
 import time
-import requests
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import List, Dict, Optional
 from src.config import Config
+from src.services.http_client import get_transport
+from src.utils.telemetry import track_external
+from src.services.deepsearch_client import ddgs_text_search
+from src.services.retrieval_cache import cached_retrieval
+from src.services.health import health_registry, CircuitOpenError
+from src.utils.rerank import engagement_of
+
+
+def _is_mcp_result(notes: List[Dict]) -> bool:
+    """只缓存 MCP 的真实结果；DDGS 回退笔记说明 MCP 暂时不可用，不能占用缓存"""
+    return bool(notes) and not any("DDGS" in (n.get("tags") or []) for n in notes)
 
 class MCPClient:
     """
@@ -25,7 +38,8 @@ class MCPClient:
         Returns:
             笔记列表 (List[Dict])
         """
-        return self._search_api(keyword, limit)
+        return cached_retrieval("xhs", keyword, lambda: self._search_api(keyword, limit), params={"limit": limit},
+                                accept=_is_mcp_result)
             
     def _search_api(self, keyword: str, limit: int) -> List[Dict]:
         """调用真实 API (如果失败则回退到 DDGS 真实搜索)"""
@@ -33,27 +47,131 @@ class MCPClient:
             print(f"Connecting to MCP Server at {self.endpoint}...")
             payload = {"keyword": keyword, "count": limit}
             # 缩短超时时间，以便快速回退
-            response = requests.post(f"{self.endpoint}/search", json=payload, timeout=2)
-            response.raise_for_status()
+            with health_registry.guard("mcp"), track_external("mcp", "search"):
+                response = get_transport().post(f"{self.endpoint}/search", json=payload, timeout=2, retries=0)
+                response.raise_for_status()
             data = response.json().get("data", [])
             if data:
                 return data
+        except CircuitOpenError:
+            print("⚠️ MCP Server circuit open, skipping straight to DDGS.")
         except Exception as e:
             print(f"⚠️ MCP API Call Failed ({e}). Falling back to DDGS.")
             
         return self._generate_fallback_notes(keyword, limit)
 
+    def search_facets(self, destination: str, facets: List[str] = None, limit: int = 30,
+                      deadline: float = None) -> List[Dict]:
+        """
+        多维度并发检索 (景点 / 美食 / 住宿 / 交通)
+        
+        每个维度以 "目的地 维度" 为关键词分页请求 MCP /search，所有维度在同一个总时限内并发执行；
+        结果按笔记 ID 合并去重 (记录命中的维度)，各维度内按互动量排序后轮流选取，保证维度均衡。
+        
+        Args:
+            destination: 目的地
+            facets: 维度子查询，默认 Config.MCP_FACETS；为空时退化为 search_notes
+            limit: 返回数量上限
+            deadline: 总时限 (秒)，超时未完成的维度直接丢弃
+            
+        Returns:
+            笔记列表 (List[Dict])，每条带 "facets" 字段
+        """
+        facets = Config.MCP_FACETS if facets is None else facets
+        if not facets:
+            return self.search_notes(destination, limit=limit)
+        return cached_retrieval("xhs", destination, lambda: self._search_facets(destination, facets, limit, deadline),
+                                params={"limit": limit, "facets": list(facets)}, accept=_is_mcp_result)
+
+    def _search_facets(self, destination: str, facets: List[str], limit: int, deadline: float = None) -> List[Dict]:
+        deadline_at = time.time() + (deadline or Config.MCP_FANOUT_DEADLINE)
+        per_facet = math.ceil(limit / len(facets))
+        print(f"Connecting to MCP Server at {self.endpoint} ({len(facets)} facets)...")
+        
+        pool = ThreadPoolExecutor(max_workers=len(facets), thread_name_prefix="mcp-facet")
+        futures = {
+            pool.submit(contextvars.copy_context().run, self._search_pages, f"{destination} {facet}",
+                        per_facet, deadline_at): facet
+            for facet in facets
+        }
+        done, not_done = wait(futures, timeout=max(0.0, deadline_at - time.time()))
+        for future in not_done:
+            print(f"⚠️ MCP facet '{futures[future]}' missed the deadline, dropped.")
+        by_facet = {futures[f]: f.result() for f in done}
+        # 进行中的请求在各自超时后结束，不再等待
+        pool.shutdown(wait=False, cancel_futures=True)
+        
+        notes = self._balance(by_facet, facets, limit)
+        if notes:
+            print(f"[MCP] Fan-out collected {len(notes)} notes: "
+                  + ", ".join(f"{facet}={len(by_facet.get(facet, []))}" for facet in facets))
+            return notes
+        print("⚠️ MCP fan-out returned nothing. Falling back to DDGS.")
+        return self._generate_fallback_notes(destination, limit)
+
+    def _search_pages(self, keyword: str, want: int, deadline_at: float) -> List[Dict]:
+        """分页请求单个关键词，直到凑够 want 条、没有下一页或超过总时限"""
+        notes = []
+        page_size = Config.MCP_PAGE_SIZE
+        for page in range(1, Config.MCP_MAX_PAGES + 1):
+            remaining = deadline_at - time.time()
+            if len(notes) >= want or remaining <= 0:
+                break
+            # 因总时限而缩短的请求超时不计入熔断
+            timeout = min(2, remaining)
+            is_failure = lambda e, clamped=timeout < 2: not (clamped and "Timeout" in e.__class__.__name__)
+            try:
+                payload = {"keyword": keyword, "count": page_size, "page": page}
+                with health_registry.guard("mcp", is_failure=is_failure), track_external("mcp", "search"):
+                    response = get_transport().post(f"{self.endpoint}/search", json=payload,
+                                                    timeout=timeout, retries=0)
+                    response.raise_for_status()
+                data = response.json().get("data", [])
+            except CircuitOpenError:
+                break
+            except Exception as e:
+                print(f"⚠️ MCP facet search failed ({keyword}, page {page}): {e}")
+                break
+            notes.extend(data)
+            if len(data) < page_size:
+                break
+        return notes
+
+    @staticmethod
+    def _engagement(note: Dict) -> float:
+        return engagement_of(note) or 0.0
+
+    def _balance(self, by_facet: Dict[str, List[Dict]], facets: List[str], limit: int) -> List[Dict]:
+        """按笔记 ID 去重合并，并在各维度之间轮流选取"""
+        merged: Dict[str, Dict] = {}
+        ranked = {}
+        for facet in facets:
+            ordered = []
+            for note in sorted(by_facet.get(facet, []), key=self._engagement, reverse=True):
+                note_id = str(note.get("id") or note.get("url"))
+                if note_id in merged:
+                    if facet not in merged[note_id]["facets"]:
+                        merged[note_id]["facets"].append(facet)
+                    continue
+                merged[note_id] = dict(note, facets=[facet])
+                ordered.append(note_id)
+            ranked[facet] = ordered
+        
+        selected = []
+        while len(selected) < limit and any(ranked.values()):
+            for facet in facets:
+                if ranked[facet] and len(selected) < limit:
+                    selected.append(merged[ranked[facet].pop(0)])
+        return selected
+
     def _generate_fallback_notes(self, keyword: str, limit: int) -> List[Dict]:
         """生成笔记数据 (Fallback: DDGS 真实搜索)"""
         results = []
         
         # 1. 尝试使用 DuckDuckGo 搜索小红书
         try:
-            from duckduckgo_search import DDGS
-            with DDGS() as ddgs:
-                # 搜索 site:xiaohongshu.com
-                ddgs_gen = ddgs.text(f"site:xiaohongshu.com {keyword}", max_results=limit)
-                for r in ddgs_gen:
+            # 搜索 site:xiaohongshu.com
+            for r in ddgs_text_search(f"site:xiaohongshu.com {keyword}", limit, op="xhs_search"):
                     results.append({
                         "id": f"ddg_{hash(r['href'])}",
                         "title": r.get("title"),
@@ -0,0 +1,209 @@
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from src.config import Config
+
+
+class InMemoryGraphService:
+    """
+    内存图谱服务 (Neo4jService 的替身)
+    用于离线基准测试与无数据库环境：实现与 Neo4jService 相同的写入接口，
+    数据保存在进程内字典中。不解析 Cypher，execute_query 仅计数并返回空结果。
+    """
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency: 每次"数据库往返"模拟的延迟 (秒)
+        """
+        self.latency = latency
+        self.driver = self  # 与 Neo4jService 一致：driver 非空即视为已连接
+        self.nodes: Dict[Tuple[str, str], Dict] = {}
+        # (起点标签, 起点名, 关系类型, 终点标签, 终点名) -> 属性
+        self.relationships: Dict[Tuple[str, str, str, str, str], Dict] = {}
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.round_trips += 1
+
+    def close(self):
+        pass
+
+    def execute_query(self, query: str, parameters: dict = None) -> List[Dict]:
+        self._round_trip()
+        return []
+
+    def execute_read(self, query: str, parameters: dict = None) -> List[Dict]:
+        self._round_trip()
+        return []
+
+    def clear_database(self):
+        self._round_trip()
+        with self._lock:
+            self.nodes.clear()
+            self.relationships.clear()
+
+    def _merge_node(self, label: str, name: str, props: Dict = None) -> Dict:
+        node = self.nodes.setdefault((label, name), {"name": name})
+        if props:
+            node.update(props)
+        return node
+
+    @staticmethod
+    def _tag(item: Dict, destination: str, doc_hashes: List[str] = None):
+        """与 Neo4jService 的来源记录一致：destinations / doc_hashes 去重追加"""
+        if destination is None:
+            return
+        destinations = item.setdefault("destinations", [])
+        if destination not in destinations:
+            destinations.append(destination)
+        if doc_hashes is not None:
+            known = item.setdefault("doc_hashes", [])
+            known.extend(h for h in doc_hashes if h not in known)
+
+    def execute_read_many(self, statements: list) -> List[List[Dict]]:
+        for _ in statements:
+            self._round_trip()
+        return [[] for _ in statements]
+
+    def execute_write(self, statements: list) -> List[List[Dict]]:
+        for _ in statements:
+            self._round_trip()
+        return [[] for _ in statements]
+
+    def ensure_schema(self, force: bool = False) -> dict:
+        """节点以 (标签, 键) 为字典 Key，天然唯一，无需建立约束"""
+        from src.services.neo4j_service import SCHEMA_KEYS
+        
+        return {"created": [], "existing": [f"{label.lower()}_{key}_unique" for label, key in SCHEMA_KEYS.items()],
+                "failed": {}}
+
+    def purge_destination(self, destination: str) -> int:
+        for _ in range(2):  # 与 Neo4jService 一致：一个写事务内两条语句
+            self._round_trip()
+        with self._lock:
+            for key, rel in list(self.relationships.items()):
+                if destination in rel.get("destinations", []):
+                    rel["destinations"].remove(destination)
+                    if not rel["destinations"]:
+                        del self.relationships[key]
+            exclusive = {node["name"] for (label, _), node in self.nodes.items()
+                         if label == "Document" and node.get("destinations") == [destination]}
+            deleted = []
+            for key, node in self.nodes.items():
+                if destination in node.get("destinations", []):
+                    node["destinations"].remove(destination)
+                    node["doc_hashes"] = [h for h in node.get("doc_hashes", []) if h not in exclusive]
+                    if not node["destinations"]:
+                        deleted.append(key)
+            for key in deleted:
+                del self.nodes[key]
+            for rel_key in [k for k in self.relationships if k[:2] in deleted or (k[3], k[4]) in deleted]:
+                del self.relationships[rel_key]
+        return len(deleted)
+
+    def known_documents(self, destination: str, hashes: list) -> set:
+        if not hashes:
+            return set()
+        self._round_trip()
+        with self._lock:
+            return {h for h in hashes
+                    if destination in self.nodes.get(("Document", h), {}).get("destinations", [])}
+
+    def graph_summary(self, destination: str, mode: str = "") -> dict:
+        """与 Neo4jService.graph_summary 相同的排序与截断规则"""
+        from src.services.neo4j_service import _MAX_FOODS_PER_AREA, graph_summary_limits, nearby_clusters
+        
+        limits = graph_summary_limits(mode)
+        for _ in range(3):  # 一个只读事务内三条查询
+            self._round_trip()
+        with self._lock:
+            dest_docs = {name for (label, name), node in self.nodes.items()
+                         if label == "Document" and destination in node.get("destinations", [])}
+            
+            def mentions(label: str, name: str) -> int:
+                return len(dest_docs.intersection(self.nodes.get((label, name), {}).get("doc_hashes", [])))
+            
+            def edges(rel_type: str, target_label: str) -> List[Tuple[str, str]]:
+                return [(k[1], k[4]) for k, rel in self.relationships.items()
+                        if k[0] == "Place" and k[2] == rel_type and k[3] == target_label
+                        and destination in rel.get("destinations", [])]
+            
+            prices, tags = {}, {}
+            for place, price in edges("HAS_COST", "Price"):
+                prices.setdefault(place, []).append(price)
+            for place, tag in edges("HAS_TAG", "Tag"):
+                tags.setdefault(place, []).append(tag)
+            spots = [{"name": name, "mentions": mentions("Place", name),
+                      "prices": sorted(prices.get(name, []))[:3], "tags": sorted(tags.get(name, []))[:4]}
+                     for (label, name), node in self.nodes.items()
+                     if label == "Place" and name != destination and destination in node.get("destinations", [])]
+            spots.sort(key=lambda s: (-s["mentions"], s["name"]))
+            
+            parents = {}
+            for place, parent in edges("LOCATED_IN", "Place"):
+                if parent != destination:
+                    parents.setdefault(place, []).append(parent)
+            areas = {}
+            for place, food in edges("OFFERS", "Food"):
+                for area in parents.get(place, [place]):
+                    areas.setdefault(area, set()).add(food)
+            food = [{"area": area, "foods": sorted(foods, key=lambda f: (-mentions("Food", f), f))[:_MAX_FOODS_PER_AREA]}
+                    for area, foods in areas.items()]
+            food.sort(key=lambda a: (-len(a["foods"]), a["area"]))
+            
+            pairs = edges("NEARBY", "Place")
+        return {"destination": destination, "spots": spots[:limits["spots"]], "food": food[:limits["food_areas"]],
+                "clusters": nearby_clusters(pairs, limits["clusters"])}
+
+    def create_graph_data(self, nodes: list, relationships: list, destination: str = None,
+                          documents: list = None):
+        from src.services.neo4j_service import graph_write_statements, sanitize_graph_data, source_matcher
+        
+        # 与 Neo4jService 相同的白名单过滤与分组：每条 UNWIND 语句计一次往返
+        nodes, relationships, _ = sanitize_graph_data(nodes, relationships)
+        statements = graph_write_statements(nodes, relationships, Config.NEO4J_WRITE_CHUNK_SIZE,
+                                            destination, documents)
+        if not statements:
+            return
+        self.execute_write(statements)
+        documents = documents or []
+        sources_of = source_matcher(documents)
+        with self._lock:
+            for node in nodes:
+                name = node["properties"]["name"]
+                self._tag(self._merge_node(node["type"], name), destination, sources_of(name))
+            for rel in relationships:
+                self._tag(self._merge_node(rel["source_type"], rel["source"]), destination, sources_of(rel["source"]))
+                self._tag(self._merge_node(rel["target_type"], rel["target"]), destination, sources_of(rel["target"]))
+                key = (rel["source_type"], rel["source"], rel["type"], rel["target_type"], rel["target"])
+                self._tag(self.relationships.setdefault(key, {}), destination)
+            if destination is not None:
+                for doc in documents:
+                    self._tag(self._merge_node("Document", doc["hash"], {
+                        "source": doc.get("source"), "title": doc.get("title"), "url": doc.get("url"),
+                        "ingested_at": time.time(),
+                    }), destination)
+
+    def merge_note(self, note_data: dict):
+        self._round_trip()
+        with self._lock:
+            self._merge_node("Note", note_data.get("id", "unknown"), {
+                "title": note_data.get("title", "No Title"),
+                "url": note_data.get("url", ""),
+                "author": note_data.get("author", "unknown"),
+            })
+
+    def merge_poi(self, poi_name: str, city: str, note_id: str):
+        self._round_trip()
+        with self._lock:
+            self._merge_node("Destination", city)
+            self._merge_node("POI", poi_name)
+            self.relationships.setdefault(("POI", poi_name, "LOCATED_IN", "Destination", city), {})
+            if ("Note", note_id) in self.nodes:
+                self.relationships.setdefault(("Note", note_id, "MENTIONS", "POI", poi_name), {})
@@ -1,49 +1,358 @@
+import atexit
 import os
+import re
+import threading
 try:
-    from neo4j import GraphDatabase
+    from neo4j import GraphDatabase, READ_ACCESS, WRITE_ACCESS
 except ImportError:
     GraphDatabase = None
+    READ_ACCESS, WRITE_ACCESS = "READ", "WRITE"
 from src.config import Config
+from src.utils.dedup import normalize_text
+from src.utils.telemetry import track_external
+from src.services.cassette import cassette_call
+from src.services.health import health_registry, CircuitOpenError
+
+# 抽取本体 (与 AgentManager._extract_kg_batch 中的 Ontology Schema 一致)
+ONTOLOGY_LABELS = ("Place", "Food", "Activity", "Price", "Tag")
+ONTOLOGY_RELATIONSHIPS = ("LOCATED_IN", "HAS_COST", "OFFERS", "SUITABLE_FOR", "HAS_TAG", "NEARBY")
+# 各标签 MERGE 使用的唯一键
+SCHEMA_KEYS = {**{label: "name" for label in ONTOLOGY_LABELS}, "Note": "id", "POI": "name", "Destination": "name",
+               "Document": "hash"}
+
+_IDENTIFIER_NOISE_RE = re.compile(r"[^0-9a-z]")
+_LABEL_LOOKUP = {_IDENTIFIER_NOISE_RE.sub("", label.lower()): label for label in ONTOLOGY_LABELS}
+_REL_LOOKUP = {_IDENTIFIER_NOISE_RE.sub("", rel.lower()): rel for rel in ONTOLOGY_RELATIONSHIPS}
+
+
+def _canonical(value, lookup: dict):
+    """按白名单还原标识符 (忽略大小写与分隔符，如 "place" / "has-cost")；不在白名单内返回 None"""
+    return lookup.get(_IDENTIFIER_NOISE_RE.sub("", str(value or "").lower()))
+
+
+def sanitize_graph_data(nodes: list, relationships: list) -> tuple:
+    """
+    按抽取本体过滤 LLM 输出
+    标签与关系类型无法参数化，会被拼进 Cypher，因此只接受白名单内的值；
+    其余节点/关系 (以及名称为空的) 直接丢弃。
+    
+    Returns:
+        (nodes, relationships, rejected)，rejected = {"nodes": int, "relationships": int}
+    """
+    clean_nodes, clean_rels = [], []
+    for node in nodes:
+        label = _canonical(node.get("type"), _LABEL_LOOKUP)
+        name = (node.get("properties") or {}).get("name")
+        if label and name not in (None, ""):
+            clean_nodes.append(dict(node, type=label, properties=dict(node.get("properties") or {}, name=str(name))))
+    for rel in relationships:
+        rel_type = _canonical(rel.get("type"), _REL_LOOKUP)
+        source_type = _canonical(rel.get("source_type"), _LABEL_LOOKUP)
+        target_type = _canonical(rel.get("target_type"), _LABEL_LOOKUP)
+        if rel_type and source_type and target_type and rel.get("source") not in (None, "") \
+                and rel.get("target") not in (None, ""):
+            clean_rels.append(dict(rel, type=rel_type, source_type=source_type, target_type=target_type,
+                                   source=str(rel["source"]), target=str(rel["target"])))
+    rejected = {"nodes": len(nodes) - len(clean_nodes), "relationships": len(relationships) - len(clean_rels)}
+    if rejected["nodes"] or rejected["relationships"]:
+        print(f"[Warning] Dropped {rejected['nodes']} nodes and {rejected['relationships']} relationships "
+              f"outside the ontology.")
+    return clean_nodes, clean_rels, rejected
+
+
+def _tag_destination(var: str) -> str:
+    """把 $destination 并入 var.destinations (去重)"""
+    return (f"{var}.destinations = CASE WHEN $destination IN coalesce({var}.destinations, []) "
+            f"THEN {var}.destinations ELSE coalesce({var}.destinations, []) + $destination END")
+
+
+def _tag_provenance(var: str, hashes: str) -> str:
+    """记录实体来自哪个目的地、哪些文档 (hashes 为该行来源文档哈希列表的表达式)"""
+    return (f"SET {_tag_destination(var)}, {var}.doc_hashes = coalesce({var}.doc_hashes, []) + "
+            f"[h IN {hashes} WHERE NOT h IN coalesce({var}.doc_hashes, [])]")
+
+
+def source_matcher(documents: list):
+    """
+    返回 name -> [文档哈希]：批内正文 (归一化后) 包含该实体名称的文档
+    一个批次只做一次抽取，按名称出现与否把实体归到具体文档；一篇都不包含时不记录来源。
+    """
+    texts = [(d["hash"], normalize_text(d.get("text") or "")) for d in documents or []]
+    
+    def sources_of(name: str) -> list:
+        key = normalize_text(name)
+        return [h for h, text in texts if key and key in text]
+    
+    return sources_of
+
+
+def graph_write_statements(nodes: list, relationships: list, chunk_size: int = 500,
+                           destination: str = None, documents: list = None) -> list:
+    """
+    将抽取结果按节点标签、(起点标签, 关系类型, 终点标签) 分组，
+    每组 (每 chunk_size 行) 生成一条参数化的 UNWIND 语句
+    输入须先经 sanitize_graph_data 过滤，标签与关系类型会直接拼入语句。
+    
+    给出 destination 时，实体与关系记录来源目的地，实体另记录提到它的来源文档哈希 (见 source_matcher)；
+    documents ([{hash, text, source, title, url}]) 登记为 Document 节点，
+    放在最后，与实体写入同一事务提交，抽取失败的文档下次仍会重新处理。
+    
+    Returns:
+        [(query, parameters), ...]
+    """
+    documents = documents or []
+    provenance = destination is not None
+    extra = {"destination": destination} if provenance else {}
+    sources_of = source_matcher(documents)
+    tag_a = f" {_tag_provenance('a', 'row.source_hashes')}" if provenance else ""
+    tag_b = f" {_tag_provenance('b', 'row.target_hashes')}" if provenance else ""
+    tag_n = f" {_tag_provenance('n', 'row.doc_hashes')}" if provenance else ""
+    tag_r = f" SET {_tag_destination('r')}" if provenance else ""
+
+    node_groups = {}
+    for node in nodes:
+        # 简单处理：只支持 name 属性，其他忽略
+        name = node["properties"]["name"]
+        node_groups.setdefault(node["type"], {})[name] = None
+    
+    rel_groups = {}
+    for rel in relationships:
+        key = (rel["source_type"], rel["type"], rel["target_type"])
+        rel_groups.setdefault(key, {})[(rel["source"], rel["target"])] = None
+    
+    def chunks(rows):
+        rows = list(rows)
+        for i in range(0, len(rows), chunk_size):
+            yield rows[i:i + chunk_size]
+    
+    statements = []
+    for label, names in node_groups.items():
+        for chunk in chunks(names):
+            statements.append((f"UNWIND $rows AS row MERGE (n:{label} {{name: row.name}}){tag_n}",
+                               {"rows": [dict(name=name, **({"doc_hashes": sources_of(name)} if provenance else {}))
+                                         for name in chunk], **extra}))
+    for (source_type, rel_type, target_type), pairs in rel_groups.items():
+        # 使用 MERGE 确保节点存在，防止因名称不匹配导致关系丢失
+        query = (f"UNWIND $rows AS row "
+                 f"MERGE (a:{source_type} {{name: row.source}}){tag_a} "
+                 f"MERGE (b:{target_type} {{name: row.target}}){tag_b} "
+                 f"MERGE (a)-[r:{rel_type}]->(b){tag_r}")
+        for chunk in chunks(pairs):
+            rows = [dict(source=s, target=t, **({"source_hashes": sources_of(s), "target_hashes": sources_of(t)}
+                                                if provenance else {}))
+                    for s, t in chunk]
+            statements.append((query, {"rows": rows, **extra}))
+    if provenance:
+        for chunk in chunks(documents):
+            statements.append((
+                "UNWIND $rows AS row MERGE (d:Document {hash: row.hash}) "
+                "SET d.source = row.source, d.title = row.title, d.url = row.url, d.ingested_at = timestamp(), "
+                + _tag_destination("d"),
+                {"rows": [{k: d.get(k) for k in ("hash", "source", "title", "url")} for d in chunk],
+                 "destination": destination}))
+    return statements
+
+# 该目的地已入库文档的哈希 (提及数只统计这些文档)
+_DESTINATION_DOCS = ("OPTIONAL MATCH (d:Document) WHERE $destination IN coalesce(d.destinations, []) "
+                     "WITH collect(d.hash) AS dest_docs ")
+
+# 图谱摘要各部分的条数，按旅行模式调整
+GRAPH_SUMMARY_LIMITS = {
+    "default": {"spots": 15, "food_areas": 6, "clusters": 5},
+    "吃货": {"spots": 8, "food_areas": 12, "clusters": 4},
+}
+_MAX_FOODS_PER_AREA = 6
+_MAX_CLUSTER_SIZE = 8
+
+
+def graph_summary_limits(mode: str = "") -> dict:
+    return next((v for k, v in GRAPH_SUMMARY_LIMITS.items() if k != "default" and k in (mode or "")),
+                GRAPH_SUMMARY_LIMITS["default"])
+
+
+def nearby_clusters(pairs: list, limit: int) -> list:
+    """NEARBY 边的连通分量 (至少两个地点)，按规模从大到小取前 limit 个，每个最多 _MAX_CLUSTER_SIZE 个地点"""
+    parent = {}
+    
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    
+    for a, b in pairs:
+        parent[find(a)] = find(b)
+    clusters = {}
+    for name in parent:
+        clusters.setdefault(find(name), []).append(name)
+    ranked = sorted((sorted(c) for c in clusters.values() if len(c) > 1), key=lambda c: (-len(c), c[0]))
+    return [c[:_MAX_CLUSTER_SIZE] for c in ranked[:limit]]
+
+
+def _is_unavailable(error: Exception) -> bool:
+    """仅连接类错误计入熔断；Cypher 语法/约束错误说明数据库可达"""
+    return isinstance(error, OSError) or error.__class__.__name__ in ("ServiceUnavailable", "SessionExpired")
+
+_driver = None
+_driver_lock = threading.Lock()
+_schema_report = None
+_schema_lock = threading.Lock()
+
+
+def get_driver():
+    """
+    进程内共享的 Neo4j driver (首次使用时创建并校验一次连通性)
+    driver 自带连接池，线程安全；各 Neo4jService 实例共用，不再每次请求新建连接。
+    不可用时返回 None，下次调用时重试 (熔断中直接跳过)。
+    """
+    global _driver
+    if _driver is not None:
+        return _driver
+    if Config.CASSETTE_MODE == "replay":
+        # 离线回放：所有查询都由磁带应答，不连接 bolt 地址
+        return None
+    if GraphDatabase is None:
+        print("Warning: neo4j package not found. Neo4j features disabled.")
+        return None
+    with _driver_lock:
+        if _driver is not None:
+            return _driver
+        try:
+            # 熔断中直接跳过，不再每次阻塞在不可达的 bolt 地址上
+            with health_registry.guard("neo4j"):
+                driver = GraphDatabase.driver(
+                    Config.NEO4J_URI, auth=(Config.NEO4J_USER, Config.NEO4J_PASSWORD),
+                    max_connection_pool_size=Config.NEO4J_POOL_SIZE,
+                    connection_acquisition_timeout=Config.NEO4J_ACQUIRE_TIMEOUT,
+                    max_transaction_retry_time=Config.NEO4J_MAX_RETRY_TIME,
+                )
+                try:
+                    driver.verify_connectivity()
+                except Exception:
+                    driver.close()
+                    raise
+            _driver = driver
+            atexit.register(close_driver)
+            print(f"🔌 [Neo4j] Connected to {Config.NEO4J_URI} (pool size {Config.NEO4J_POOL_SIZE}).")
+        except CircuitOpenError as e:
+            print(f"Neo4j Connection Skipped: {e}")
+        except Exception as e:
+            print(f"Neo4j Connection Failed: {e}")
+    return _driver
+
+
+def close_driver():
+    """关闭共享 driver (进程退出时自动调用)"""
+    global _driver
+    with _driver_lock:
+        driver, _driver = _driver, None
+    if driver is not None:
+        driver.close()
+
 
 class Neo4jService:
     """
     Neo4j 图谱服务
-    负责管理数据库连接、执行 Cypher 查询与写入。
+    负责执行 Cypher 查询与写入；连接由进程内共享的 driver 连接池管理 (见 get_driver)。
+    所有语句都在托管事务 (execute_read / execute_write) 中执行，瞬时错误与集群切主由 driver 自动重试。
     """
     
     def __init__(self):
         self.uri = Config.NEO4J_URI
-        self.user = Config.NEO4J_USER
-        self.password = Config.NEO4J_PASSWORD
-        self.driver = None
+        self.driver = get_driver()
+        if self.driver and Config.NEO4J_SCHEMA_BOOTSTRAP:
+            try:
+                self.ensure_schema()
+            except Exception as e:
+                print(f"[Warning] Neo4j schema bootstrap failed: {e}")
+
+    def ensure_schema(self, force: bool = False) -> dict:
+        """
+        幂等的 schema 初始化：为每个标签的 MERGE 键建立唯一约束
+        (约束自带索引，MERGE 不再逐个扫描整个标签)。每个进程只执行一次，结果缓存。
         
-        self._connect()
-            
-    def _connect(self):
-        if GraphDatabase is None:
-            print("Warning: neo4j package not found. Neo4j features disabled.")
-            self.driver = None
-            return
-        try:
-            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
-            self.driver.verify_connectivity()
-        except Exception as e:
-            print(f"Neo4j Connection Failed: {e}")
-            self.driver = None
+        Returns:
+            {"created": [约束名], "existing": [约束名], "failed": {约束名: 错误}}
+        """
+        global _schema_report
+        if not self.driver:
+            return {"created": [], "existing": [], "failed": {}}
+        with _schema_lock:
+            if _schema_report is not None and not force:
+                return _schema_report
+            # 同一 (标签, 键) 上已有任何名称的唯一约束都视为已存在
+            existing = {
+                (row["labelsOrTypes"][0], row["properties"][0])
+                for row in self.execute_read("SHOW CONSTRAINTS YIELD labelsOrTypes, properties, type "
+                                             "WHERE type IN ['UNIQUENESS', 'NODE_PROPERTY_UNIQUENESS', 'NODE_KEY'] "
+                                             "RETURN labelsOrTypes, properties")
+                if len(row["labelsOrTypes"] or []) == 1 and len(row["properties"] or []) == 1
+            }
+            report = {"created": [], "existing": [], "failed": {}}
+            for label, key in SCHEMA_KEYS.items():
+                name = f"{label.lower()}_{key}_unique"
+                if (label, key) in existing:
+                    report["existing"].append(name)
+                    continue
+                try:
+                    self.execute_query(f"CREATE CONSTRAINT {name} IF NOT EXISTS "
+                                       f"FOR (n:{label}) REQUIRE n.{key} IS UNIQUE")
+                    report["created"].append(name)
+                except Exception as e:
+                    # 已有重复数据时无法建立约束，不影响其余标签
+                    report["failed"][name] = str(e)[:200]
+                    print(f"[Warning] Neo4j constraint {name} not created: {e}")
+            print(f"🗂️ [Neo4j] Schema ready: {len(report['created'])} constraints created, "
+                  f"{len(report['existing'])} existing, {len(report['failed'])} failed.")
+            _schema_report = report
+            return report
 
     def close(self):
-        if self.driver:
-            self.driver.close()
+        """共享 driver 由进程退出时统一关闭 (close_driver)，这里无需处理"""
             
     def execute_query(self, query: str, parameters: dict = None):
-        """执行 Cypher 查询"""
+        """在写事务中执行 Cypher 查询 (开启 CASSETTE_MODE 时经由磁带录制/回放)"""
+        return cassette_call("neo4j", {"query": query, "parameters": parameters},
+                             lambda: self._run_tx([(query, parameters)], write=True)[0])
+
+    def execute_read(self, query: str, parameters: dict = None):
+        """在只读事务中执行 Cypher 查询 (集群部署时可路由到只读副本)"""
+        return cassette_call("neo4j", {"read": query, "parameters": parameters},
+                             lambda: self._run_tx([(query, parameters)], write=False)[0])
+
+    def execute_read_many(self, statements: list) -> list:
+        """在一个只读事务中依次执行多条语句，返回每条语句的结果"""
+        return cassette_call("neo4j", {"read_many": [[q, p] for q, p in statements]},
+                             lambda: self._run_tx(statements, write=False))
+
+    def execute_write(self, statements: list):
+        """
+        在一个托管写事务中依次执行多条语句 (开启 CASSETTE_MODE 时经由磁带录制/回放)
+        
+        Args:
+            statements: [(query, parameters), ...]
+        """
+        return cassette_call("neo4j", {"write": [[q, p] for q, p in statements]},
+                             lambda: self._run_tx(statements, write=True))
+
+    def _run_tx(self, statements: list, write: bool = True) -> list:
+        """
+        在一个托管事务中执行语句，返回每条语句的结果记录列表
+        事务函数可能因瞬时错误被 driver 重新执行，结果须在函数内读取完毕。
+        """
         if not self.driver:
-            print(f"⚠️ [Neo4j-Disconnected] Cannot execute: {query[:50]}...")
-            return []
-            
-        with self.driver.session() as session:
-            result = session.run(query, parameters)
-            return [record.data() for record in result]
+            print(f"⚠️ [Neo4j-Disconnected] Cannot execute: {statements[0][0][:50]}...")
+            return [[] for _ in statements]
+        
+        def work(tx):
+            return [[record.data() for record in tx.run(query, parameters)] for query, parameters in statements]
+        
+        access = WRITE_ACCESS if write else READ_ACCESS
+        with health_registry.guard("neo4j", is_failure=_is_unavailable), \
+                track_external("neo4j", "write_tx" if write else "read_tx"), \
+                self.driver.session(database=Config.NEO4J_DATABASE, default_access_mode=access) as session:
+            return session.execute_write(work) if write else session.execute_read(work)
 
     def clear_database(self):
         """清空数据库"""
@@ -51,34 +360,94 @@ class Neo4jService:
         print("🧹 [Neo4j] Clearing database...")
         self.execute_query("MATCH (n) DETACH DELETE n")
 
-    def create_graph_data(self, nodes: list, relationships: list):
+    def purge_destination(self, destination: str) -> int:
+        """
+        按目的地清理图谱 (取代全库清空)
+        从各节点/关系的来源中移除该目的地，仅属于该目的地的节点、关系与文档被删除，
+        与其他目的地共享的实体保留。
+        
+        Returns:
+            删除的节点数
+        """
+        print(f"🧹 [Neo4j] Purging graph data for {destination}...")
+        results = self.execute_write([
+            ("MATCH ()-[r]->() WHERE $destination IN coalesce(r.destinations, []) "
+             "SET r.destinations = [x IN r.destinations WHERE x <> $destination] "
+             "WITH r WHERE size(r.destinations) = 0 DELETE r",
+             {"destination": destination}),
+            # 只属于该目的地的文档哈希从实体的来源中移除
+            ("OPTIONAL MATCH (d:Document) WHERE d.destinations = [$destination] "
+             "WITH collect(d.hash) AS hashes "
+             "MATCH (n) WHERE $destination IN coalesce(n.destinations, []) "
+             "SET n.destinations = [x IN n.destinations WHERE x <> $destination], "
+             "n.doc_hashes = [h IN coalesce(n.doc_hashes, []) WHERE NOT h IN hashes] "
+             "WITH n WHERE size(n.destinations) = 0 "
+             "DETACH DELETE n RETURN count(*) AS deleted",
+             {"destination": destination}),
+        ])
+        return results[1][0]["deleted"] if results and results[1] else 0
+
+    def known_documents(self, destination: str, hashes: list) -> set:
+        """返回已为该目的地入库过的文档哈希"""
+        if not hashes: return set()
+        rows = self.execute_read("MATCH (d:Document) WHERE d.hash IN $hashes AND $destination IN d.destinations "
+                                 "RETURN d.hash AS hash", {"hashes": list(hashes), "destination": destination})
+        return {row["hash"] for row in rows}
+
+    def graph_summary(self, destination: str, mode: str = "") -> dict:
+        """
+        面向规划的紧凑图谱摘要 (只读，一个事务内三条查询)
+        - spots: 按提及数 (该目的地的来源文档中提到它的篇数) 排序的热门地点，附价格与标签
+        - food: 各区域 (LOCATED_IN 的上级地点，没有时为地点本身) 的美食，按提及数排序
+        - clusters: NEARBY 关系连成的邻近地点群
+        只统计为该目的地抽取的关系与文档 (见 graph_write_statements 的来源记录)；
+        同名实体按名称全局合并，其他城市的文档不计入提及数。
+        
+        Returns:
+            {"destination", "spots": [{name, mentions, prices, tags}], "food": [{area, foods}], "clusters": [[name]]}
+        """
+        summary = {"destination": destination, "spots": [], "food": [], "clusters": []}
+        limits = graph_summary_limits(mode)
+        params = {"destination": destination, "spots": limits["spots"], "food_areas": limits["food_areas"]}
+        spots, food, pairs = self.execute_read_many([
+            (_DESTINATION_DOCS +
+             "MATCH (p:Place) WHERE $destination IN coalesce(p.destinations, []) AND p.name <> $destination "
+             "OPTIONAL MATCH (p)-[c:HAS_COST]->(price:Price) WHERE $destination IN coalesce(c.destinations, []) "
+             "OPTIONAL MATCH (p)-[t:HAS_TAG]->(tag:Tag) WHERE $destination IN coalesce(t.destinations, []) "
+             "WITH p, dest_docs, collect(DISTINCT price.name) AS prices, collect(DISTINCT tag.name) AS tags "
+             "RETURN p.name AS name, size([h IN coalesce(p.doc_hashes, []) WHERE h IN dest_docs]) AS mentions, "
+             "prices[..3] AS prices, tags[..4] AS tags ORDER BY mentions DESC, name LIMIT $spots", params),
+            (_DESTINATION_DOCS +
+             "MATCH (p:Place)-[o:OFFERS]->(f:Food) WHERE $destination IN coalesce(o.destinations, []) "
+             "OPTIONAL MATCH (p)-[l:LOCATED_IN]->(parent:Place) "
+             "WHERE $destination IN coalesce(l.destinations, []) AND parent.name <> $destination "
+             "WITH coalesce(parent.name, p.name) AS area, f, dest_docs "
+             "ORDER BY size([h IN coalesce(f.doc_hashes, []) WHERE h IN dest_docs]) DESC, f.name "
+             "WITH area, collect(DISTINCT f.name) AS foods "
+             f"RETURN area, foods[..{_MAX_FOODS_PER_AREA}] AS foods "
+             "ORDER BY size(foods) DESC, area LIMIT $food_areas", params),
+            ("MATCH (a:Place)-[n:NEARBY]->(b:Place) WHERE $destination IN coalesce(n.destinations, []) "
+             "RETURN a.name AS a, b.name AS b", params),
+        ])
+        summary["spots"] = spots
+        summary["food"] = food
+        summary["clusters"] = nearby_clusters([(r["a"], r["b"]) for r in pairs], limits["clusters"])
+        return summary
+
+    def create_graph_data(self, nodes: list, relationships: list, destination: str = None,
+                          documents: list = None):
         """
         基于简单的 Ontology Schema 写入数据
         Nodes: [{id, type, properties}]
         Relationships: [{source, target, type, properties}]
+        destination / documents: 来源目的地与来源文档 ([{hash, source, title, url}])，见 graph_write_statements
         """
-        if not self.driver: return
-        
-        # 1. Create Nodes
-        for node in nodes:
-            props = node.get("properties", {})
-            # 简单处理：只支持 name 属性，其他忽略或作为额外属性
-            # 实际生产中应动态构建 SET 子句
-            cypher = f"MERGE (n:{node['type']} {{name: $name}})"
-            self.execute_query(cypher, {"name": props.get("name", "Unknown")})
-            
-        # 2. Create Relationships
-        for rel in relationships:
-            # 使用 MERGE 确保节点存在，防止因名称不匹配导致关系丢失
-            cypher = f"""
-            MERGE (a:{rel['source_type']} {{name: $source_name}})
-            MERGE (b:{rel['target_type']} {{name: $target_name}})
-            MERGE (a)-[:{rel['type']}]->(b)
-            """
-            self.execute_query(cypher, {
-                "source_name": rel["source"],
-                "target_name": rel["target"]
-            })
+        nodes, relationships, _ = sanitize_graph_data(nodes, relationships)
+        statements = graph_write_statements(nodes, relationships, Config.NEO4J_WRITE_CHUNK_SIZE,
+                                            destination, documents)
+        if statements:
+            # 整批在一个写事务中提交：往返次数与标签/关系类型数相关，而非实体数
+            self.execute_write(statements)
             
     def merge_note(self, note_data: dict):
         """
@@ -118,3 +487,21 @@ class Neo4jService:
         MERGE (n)-[:MENTIONS]->(p)
         """
         self.execute_query(cypher, {"city": city, "poi_name": poi_name, "note_id": note_id})
+
+
+_memory_graph = None
+
+
+def get_graph_service():
+    """
+    按 GRAPH_BACKEND 配置返回图谱服务
+    - neo4j (默认): Neo4jService (实例很轻，共用进程内的 driver 连接池)
+    - memory: 进程内共享的 InMemoryGraphService (离线基准/无数据库环境)
+    """
+    global _memory_graph
+    if Config.GRAPH_BACKEND == "memory":
+        if _memory_graph is None:
+            from src.services.memory_graph import InMemoryGraphService
+            _memory_graph = InMemoryGraphService()
+        return _memory_graph
+    return Neo4jService()
@@ -0,0 +1,211 @@
+import re
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.config import Config
+from src.utils.telemetry import metrics
+
+
+class PlanQueueFull(RuntimeError):
+    """准入控制：排队中的任务已达上限"""
+
+
+def normalize_request(user_input: str, mode: str, with_map: bool = False) -> str:
+    """
+    归一化请求，用于合并相同的在途任务
+    目的地与天数按 run_flow 的规则解析 ("西安 3天" / "西安  3 天" 视为相同)，其余描述按空白归一后保留。
+    """
+    text = " ".join(user_input.split())
+    destination, _, rest = text.partition(" ")
+    days = re.search(r"(\d+)\s*天", rest)
+    if days:
+        rest = (rest[:days.start()] + rest[days.end():]).strip()
+    return "|".join([destination.lower(), days.group(1) if days else "", " ".join(rest.split()).lower(),
+                     mode, "map" if with_map else ""])
+
+
+class PlanJob:
+    """
+    行程规划任务句柄
+    事件 (见 AgentManager.run_flow 的 on_event) 全部保留在任务中，
+    页面刷新或重新运行后可从任意位置重新订阅，直到收到 result 事件。
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, key: str, user_input: str, mode: str, with_map: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.user_input = user_input
+        self.mode = mode
+        self.with_map = with_map
+        self.status = self.QUEUED
+        self.plan: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.subscribers = 1  # 合并到本任务的请求数
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._events: List[Dict] = []
+        self._cond = threading.Condition()
+
+    def done(self) -> bool:
+        return self.status in (self.DONE, self.FAILED)
+
+    def wait(self, timeout: float = None) -> bool:
+        """阻塞直到任务结束，返回是否已结束"""
+        with self._cond:
+            return self._cond.wait_for(self.done, timeout)
+
+    def _push(self, event: Dict):
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def _finish(self, status: str, plan: dict = None, error: str = None):
+        with self._cond:
+            self.plan = plan or {}
+            self.error = error
+            self.finished_at = time.time()
+            self._events.append({"type": "result", "plan": self.plan})
+            self.status = status
+            self._cond.notify_all()
+
+    def events_since(self, cursor: int = 0, timeout: float = None) -> Tuple[List[Dict], int]:
+        """返回 cursor 之后的事件与新的 cursor；没有新事件时最多等待 timeout 秒"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._events) > cursor or self.done(), timeout)
+            events = self._events[cursor:]
+            return events, cursor + len(events)
+
+    def stream(self, cursor: int = 0) -> Iterator[Dict]:
+        """从 cursor 开始逐个产出事件，最后一个为 {"type": "result", "plan": dict}"""
+        while True:
+            events, cursor = self.events_since(cursor)
+            for event in events:
+                yield event
+                if event["type"] == "result":
+                    return
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "user_input": self.user_input,
+            "mode": self.mode,
+            "status": self.status,
+            "subscribers": self.subscribers,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class PlanJobQueue:
+    """
+    行程规划任务队列 (submit / poll / result)
+    - 规划在有界线程池中执行，与 Streamlit 脚本线程及浏览器连接解耦，刷新页面不会丢弃进行中的任务
+    - 归一化后相同 (目的地/天数/模式) 的在途请求合并到同一任务，避免重复的 LLM 开销
+    - 准入控制：排队任务数超过上限时拒绝新任务 (PlanQueueFull)
+    """
+
+    def __init__(self, max_workers: int = None, max_queued: int = None, max_history: int = 100):
+        self.max_workers = max_workers or Config.PLAN_JOB_WORKERS
+        self.max_queued = Config.PLAN_JOB_MAX_QUEUED if max_queued is None else max_queued
+        self.max_history = max_history
+        self._jobs: Dict[str, PlanJob] = {}
+        self._inflight: Dict[str, PlanJob] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, user_input: str, mode: str, with_map: bool = False) -> PlanJob:
+        """提交规划任务；相同的在途请求返回已有任务"""
+        key = normalize_request(user_input, mode, with_map)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                job.subscribers += 1
+                metrics.inc_plan_jobs("coalesced")
+                print(f"🧾 [PlanJobs] Request coalesced onto job {job.id} ({job.subscribers} subscribers).")
+                return job
+            # 在途任务 = 执行中 (最多 max_workers) + 排队中；刚提交尚未被线程领取的任务也计入
+            if len(self._inflight) >= self.max_workers + self.max_queued:
+                metrics.inc_plan_jobs("rejected")
+                raise PlanQueueFull(f"Plan queue is full ({self.max_queued} jobs waiting), please retry later")
+            job = PlanJob(key, user_input, mode, with_map)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self._trim_history()
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="plan-job")
+            self._pool.submit(self._run, job)
+            metrics.inc_plan_jobs("submitted")
+            self._update_gauges()
+        print(f"🧾 [PlanJobs] Job {job.id} queued: {user_input} ({mode}).")
+        return job
+
+    def get(self, job_id: str) -> Optional[PlanJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        job = self.get(job_id)
+        return job.to_dict() if job else None
+
+    def result(self, job_id: str, timeout: float = None) -> Optional[dict]:
+        """等待任务结束并返回计划 (失败时为空字典)；任务不存在或超时返回 None"""
+        job = self.get(job_id)
+        if job is None or not job.wait(timeout):
+            return None
+        return job.plan
+
+    def depth(self) -> Dict[str, int]:
+        with self._lock:
+            return {"queued": self._count(PlanJob.QUEUED), "running": self._count(PlanJob.RUNNING)}
+
+    def _count(self, status: str) -> int:
+        return sum(1 for job in self._inflight.values() if job.status == status)
+
+    def _update_gauges(self):
+        metrics.set_gauge("plan_jobs_queued", self._count(PlanJob.QUEUED))
+        metrics.set_gauge("plan_jobs_running", self._count(PlanJob.RUNNING))
+
+    def _trim_history(self):
+        finished = [j for j in self._jobs.values() if j.done()]
+        overflow = len(self._jobs) - self.max_history
+        for job in sorted(finished, key=lambda j: j.submitted_at)[:max(0, overflow)]:
+            del self._jobs[job.id]
+
+    def _run(self, job: PlanJob):
+        from src.agents.manager import manager
+
+        with self._lock:
+            job.status = PlanJob.RUNNING
+            job.started_at = time.time()
+            self._update_gauges()
+        plan, error = {}, None
+        try:
+            plan = manager.run_flow(job.user_input, job.mode, with_map=job.with_map, on_event=job._push)
+            if not plan:
+                error = "pipeline returned no plan"
+        except Exception as e:
+            error = str(e)
+            traceback.print_exc()
+        with self._lock:
+            self._inflight.pop(job.key, None)
+            job._finish(PlanJob.FAILED if error else PlanJob.DONE, plan, error)
+            metrics.inc_plan_jobs(job.status)
+            self._update_gauges()
+        print(f"🧾 [PlanJobs] Job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s "
+              f"({job.subscribers} subscribers).")
+
+
+# 单例
+plan_job_queue = PlanJobQueue()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from src.config import Config
+from src.services.llm_cache import LLMCache
+
+
+class RetrievalCache(LLMCache):
+    """
+    检索结果磁盘缓存 (小红书笔记 / 全网搜索)
+    以 (来源, 归一化查询, 参数) 的哈希作为 Key，复用 LLMCache 的存储与容量淘汰。
+    读取按来源区分新鲜期，并支持 stale-while-revalidate：
+    - 新鲜期内：直接返回
+    - 过期但仍在 stale 窗口内：立即返回旧结果，同时在后台刷新
+    - 超出 stale 窗口：视为未命中，同步加载
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None, ttls: Dict[str, float] = None,
+                 stale_ttl: float = None):
+        # 过期由读取时按来源判定，磁盘层只做容量淘汰
+        super().__init__(cache_dir or Config.RETRIEVAL_CACHE_DIR,
+                         max_bytes or Config.RETRIEVAL_CACHE_MAX_MB * 1024 * 1024, ttl=0)
+        self.ttls = ttls or {"xhs": Config.RETRIEVAL_CACHE_TTL_XHS, "web": Config.RETRIEVAL_CACHE_TTL_WEB}
+        self.stale_ttl = Config.RETRIEVAL_CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+        self.stats.update({"stale": 0, "refreshes": 0, "refresh_errors": 0})
+        self._refreshing = set()
+
+    @staticmethod
+    def make_key(source: str, query: str, params: Dict = None) -> str:
+        raw = json.dumps({"source": source, "query": " ".join(query.split()).lower(), "params": params or {}},
+                         ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _read(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def fetch(self, source: str, query: str, loader: Callable[[], Any], params: Dict = None,
+              accept: Callable[[Any], bool] = bool) -> Any:
+        """
+        读取缓存，未命中时调用 loader 加载
+
+        Args:
+            source: 来源 (xhs / web)，决定新鲜期
+            query: 查询词 (归一化空白与大小写后参与 Key)
+            loader: 实际检索函数
+            params: 其他影响结果的参数 (如数量)
+            accept: 结果是否可缓存 (默认空结果不缓存，避免把降级失败固化下来)
+        """
+        key = self.make_key(source, query, params)
+        entry = self._read(key)
+        if entry is not None:
+            age = time.time() - entry.get("created_at", 0)
+            ttl = self.ttls.get(source, 0)
+            if age <= ttl:
+                self._touch(key)
+                self._count("hits")
+                return entry.get("response")
+            if age <= ttl + self.stale_ttl:
+                self._touch(key)
+                self._count("stale")
+                self._refresh_async(key, source, query, loader, accept)
+                return entry.get("response")
+            self._remove(self._path(key))
+
+        self._count("misses")
+        value = loader()
+        if accept(value):
+            self.put(key, value)
+        return value
+
+    def _touch(self, key: str):
+        try:
+            os.utime(self._path(key))  # 刷新访问时间，用于 LRU 淘汰
+        except OSError:
+            pass
+
+    def _refresh_async(self, key: str, source: str, query: str, loader: Callable[[], Any],
+                       accept: Callable[[Any], bool]):
+        """同一 Key 同时只有一个后台刷新"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = loader()
+                if accept(value):
+                    self.put(key, value)
+                self._count("refreshes")
+                print(f"♻️ [RetrievalCache] Refreshed {source}: {query}")
+            except Exception as e:
+                self._count("refresh_errors")
+                print(f"[Warning] Retrieval cache refresh failed ({source}: {query}): {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"retrieval-refresh-{source}", daemon=True).start()
+
+
+_cache: Optional[RetrievalCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> Optional[RetrievalCache]:
+    """获取共享检索缓存；未开启 RETRIEVAL_CACHE_ENABLED 时返回 None"""
+    global _cache
+    if not Config.RETRIEVAL_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RetrievalCache()
+    return _cache
+
+
+def cached_retrieval(source: str, query: str, loader: Callable[[], Any], params: Dict = None,
+                     accept: Callable[[Any], bool] = bool) -> Any:
+    """缓存关闭时直接调用 loader，否则经由检索缓存 (accept 见 RetrievalCache.fetch)"""
+    cache = get_retrieval_cache()
+    if cache is None:
+        return loader()
+    return cache.fetch(source, query, loader, params, accept=accept)
@@ -0,0 +1,147 @@
+import re
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_ENCODING = None
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def _get_encoding():
+    global _ENCODING
+    if _ENCODING is None and tiktoken is not None:
+        try:
+            _ENCODING = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _ENCODING = False
+    return _ENCODING or None
+
+
+def count_tokens(text: str) -> int:
+    """
+    估算 token 数
+    优先使用 tiktoken；未安装时使用启发式：CJK 字符按 1 token/字，其余按 4 字符/token。
+    """
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc:
+        return len(enc.encode(text, disallowed_special=()))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """将文本截断到不超过 max_tokens (含后缀)"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens - count_tokens(suffix)
+    if budget <= 0:
+        return ""
+    enc = _get_encoding()
+    if enc:
+        return enc.decode(enc.encode(text, disallowed_special=())[:budget]) + suffix
+    # 启发式下 token 数随字符数单调递增，二分查找最长前缀
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + suffix
+
+
+class Snippet:
+    """待打包的候选片段"""
+
+    def __init__(self, source: str, text: str, priority: float = 0.0):
+        self.source = source
+        self.text = text
+        self.priority = priority
+
+
+class PackedContext:
+    """打包结果：按来源分组的片段 + 每个来源的 token 消耗"""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.sections: Dict[str, List[str]] = {}
+        self.usage: Dict[str, int] = {}
+        self.candidates: Dict[str, int] = {}
+        self.truncated = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.usage.values())
+
+    def render(self, headers: Dict[str, str] = None) -> str:
+        """
+        渲染为 Prompt 文本
+
+        Args:
+            headers: {source: 标题模板}，模板可使用 {count}，例如 "【小红书热点 ({count}篇)】"
+        """
+        headers = headers or {}
+        blocks = []
+        for source, lines in self.sections.items():
+            if not lines:
+                continue
+            header = headers.get(source, f"【{source} ({{count}}篇)】").format(count=len(lines))
+            blocks.append(header + "\n" + "\n".join(lines))
+        return "\n\n".join(blocks)
+
+    def summary(self) -> str:
+        parts = [f"{s}: {len(self.sections.get(s, []))}/{self.candidates[s]} docs, {self.usage.get(s, 0)} tok"
+                 for s in self.candidates]
+        return f"{self.total_tokens}/{self.budget} tokens ({'; '.join(parts)}; truncated {self.truncated})"
+
+
+class ContextPacker:
+    """
+    Token 预算内的上下文打包器
+    按优先级从高到低依次放入片段；放不下的片段在剩余预算足够时截断放入，否则丢弃。
+    同优先级保持加入顺序，渲染时各来源内部也按该顺序排列。
+    """
+
+    def __init__(self, budget_tokens: int, max_tokens_per_snippet: Optional[int] = None,
+                 min_tokens_per_snippet: int = 32):
+        self.budget = budget_tokens
+        self.max_per_snippet = max_tokens_per_snippet
+        self.min_per_snippet = min_tokens_per_snippet
+        self.snippets: List[Snippet] = []
+
+    def add(self, source: str, text: str, priority: float = 0.0) -> "ContextPacker":
+        if text:
+            self.snippets.append(Snippet(source, text, priority))
+        return self
+
+    def pack(self) -> PackedContext:
+        packed = PackedContext(self.budget)
+        for snip in self.snippets:
+            packed.candidates[snip.source] = packed.candidates.get(snip.source, 0) + 1
+            packed.sections.setdefault(snip.source, [])
+
+        remaining = self.budget
+        for snip in sorted(self.snippets, key=lambda s: -s.priority):
+            if remaining < self.min_per_snippet:
+                break
+            text = snip.text
+            limit = min(remaining, self.max_per_snippet or remaining)
+            tokens = count_tokens(text)
+            if tokens > limit:
+                text = truncate_to_tokens(text, limit)
+                tokens = count_tokens(text)
+                packed.truncated += 1
+                if tokens < self.min_per_snippet:
+                    continue
+            packed.sections[snip.source].append(text)
+            packed.usage[snip.source] = packed.usage.get(snip.source, 0) + tokens
+            remaining -= tokens
+
+        return packed
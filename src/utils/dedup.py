@@ -0,0 +1,98 @@
+import hashlib
+import re
+import zlib
+from itertools import combinations
+from typing import List, Sequence
+
+import numpy as np
+
+_NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize_text(text: str) -> str:
+    """去掉空白与标点并转小写，使转载/排版差异不影响相似度"""
+    return _NON_WORD_RE.sub("", (text or "").lower())
+
+
+def content_hash(text: str) -> str:
+    """文档内容指纹 (归一化后的 SHA-256)，排版与标点差异不影响结果"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def shingles(text: str, k: int = 5) -> set:
+    """字符 k-gram 集合 (中文无需分词)；不足 k 个字符时整体作为一个 shingle"""
+    norm = normalize_text(text)
+    if len(norm) <= k:
+        return {norm} if norm else set()
+    return {norm[i:i + k] for i in range(len(norm) - k + 1)}
+
+
+class MinHasher:
+    """
+    MinHash 签名
+    h_i(x) = (a_i * x + b_i) mod p，x 为 shingle 的 32 位 CRC；签名为各 h_i 在集合上的最小值。
+    两个集合签名相同位置相等的比例是其 Jaccard 相似度的无偏估计。
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # a, b < 2^32 且 x < 2^32，a * x + b 不会溢出 uint64
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        grams = shingles(text, self.shingle_size)
+        if not grams:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        hashed = (np.outer(x, self.a) + self.b) % _MERSENNE_PRIME
+        return (hashed & _MAX_HASH).min(axis=0)
+
+
+def near_duplicate_clusters(texts: Sequence[str], threshold: float = 0.7, num_perm: int = 64,
+                            shingle_size: int = 5, bands: int = 16) -> List[List[int]]:
+    """
+    找出近似重复的文本簇 (MinHash + LSH 分桶)
+
+    签名切成 bands 段，任一段完全相同的文本成为候选对，再用签名估计的 Jaccard 相似度
+    (不低于 threshold) 确认；确认的对用并查集合并成簇。
+
+    Returns:
+        每个簇的下标列表 (按原始顺序)，未重复的文本各自成簇
+    """
+    n = len(texts)
+    if n < 2:
+        return [[i] for i in range(n)]
+    hasher = MinHasher(num_perm, shingle_size)
+    signatures = np.stack([hasher.signature(t) for t in texts])
+    rows = num_perm // bands
+
+    parent = list(range(n))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked = set()
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(map(bytes, signatures[:, band * rows:(band + 1) * rows])):
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for i, j in combinations(members, 2):
+                if (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                if find(i) != find(j) and np.mean(signatures[i] == signatures[j]) >= threshold:
+                    parent[find(j)] = find(i)
+
+    clusters = {}
+    for i in range(n):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda c: c[0])
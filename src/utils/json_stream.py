@@ -0,0 +1,200 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# 未闭合的起点最多尝试次数 (每次尝试都会扫描到文本末尾)
+_MAX_UNCLOSED_STARTS = 16
+
+
+def _scan_balanced(text: str, start: int) -> int:
+    """
+    从 text[start] == '{' 开始扫描，返回与之配对的 '}' 下标；未闭合时返回 -1。
+    正确处理字符串内的括号与转义。
+    """
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def extract_first_json_object(text: str) -> dict:
+    """
+    提取文本中第一个平衡且合法的 JSON 对象
+    可容忍 Markdown 代码块、前后说明文字以及说明文字中的多余括号 (包括未闭合的括号)；失败返回 {}。
+    平衡但非法的对象整体跳过，不会退而返回其内部的片段。
+
+    >>> extract_first_json_object('说明 { 未闭合 {"a": 1}')
+    {'a': 1}
+    >>> extract_first_json_object('{"nodes": [{"id": "x"},], "relationships": []}')
+    {}
+    >>> extract_first_json_object('{"bad": [{"day": 1},]} 之后 {"ok": true}')
+    {'ok': True}
+    """
+    if not text:
+        return {}
+    start = text.find("{")
+    unclosed = 0
+    while start != -1:
+        # JSON 对象的 "{" 后只能是 '"' 或 '}'，其余起点无需扫描
+        body = text[start + 1:start + 65].lstrip()
+        if body and body[0] not in '"}':
+            start = text.find("{", start + 1)
+            continue
+        end = _scan_balanced(text, start)
+        if end == -1:
+            # 说明文字中未闭合的 "{"：从下一个 "{" 继续
+            unclosed += 1
+            if unclosed >= _MAX_UNCLOSED_STARTS:
+                break
+            start = text.find("{", start + 1)
+            continue
+        try:
+            value = json.loads(text[start:end + 1])
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError:
+            pass
+        # 从该对象之后继续，避免把非法对象内部的片段当作结果
+        start = text.find("{", end + 1)
+    return {}
+
+
+class StreamingJSONParser:
+    """
+    增量 JSON 解析器
+    逐块 feed 流式输出，单次线性扫描；根对象中指定数组 (默认 itinerary) 的元素
+    一旦闭合就立即解析并返回，使 UI 可以在后续元素仍在生成时先渲染已完成的部分。
+    """
+
+    def __init__(self, array_key: str = "itinerary"):
+        self.array_key = array_key
+        self.buffer = ""
+        self._pos = 0
+        self._root_start: Optional[int] = None
+        self._root_end: Optional[int] = None
+        self._root_checked = False
+        self._root: Any = None
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        # 容器栈: [(符号, 该容器在父对象中的 key)]
+        self._stack: List[tuple] = []
+        self._item_start: Optional[int] = None
+        self.items: List[Any] = []
+
+    @property
+    def complete(self) -> bool:
+        return self._root_end is not None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """输入一段文本，返回本次新完成的数组元素"""
+        if self.complete or not chunk:
+            return []
+        self.buffer += chunk
+        completed = []
+        text = self.buffer
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._root_start is None:
+                if ch == "{":
+                    self._root_start = i
+                    self._stack.append(("{", None))
+                i += 1
+                continue
+
+            if not self._root_checked:
+                # JSON 对象的 "{" 后只能是 '"' 或 '}'；说明文字中的括号 (可能永不闭合) 直接跳过
+                if ch.isspace():
+                    i += 1
+                    continue
+                if ch not in '"}':
+                    i = self._root_start + 1
+                    self._reset_root()
+                    continue
+                self._root_checked = True
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif ch == ":":
+                self._key = self._last_string
+            elif ch in "{[":
+                parent_key = self._key if self._stack and self._stack[-1][0] == "{" else None
+                if ch == "{" and self._is_target_array():
+                    self._item_start = i
+                self._stack.append((ch, parent_key))
+                self._key = None
+            elif ch in "}]":
+                self._stack.pop()
+                if ch == "}" and self._item_start is not None and self._is_target_array():
+                    try:
+                        item = json.loads(text[self._item_start:i + 1])
+                        self.items.append(item)
+                        completed.append(item)
+                    except json.JSONDecodeError:
+                        pass
+                    self._item_start = None
+                if not self._stack:
+                    try:
+                        self._root = json.loads(text[self._root_start:i + 1])
+                    except json.JSONDecodeError:
+                        # 平衡但非法的根对象 (如多余的逗号)：整体跳过，从其闭合括号之后继续寻找根对象，
+                        # 已推送的元素属于非法对象，一并丢弃
+                        i += 1
+                        self._reset_root()
+                        self.items = []
+                        continue
+                    self._root_end = i
+                    i += 1
+                    break
+            elif ch == ",":
+                self._key = None
+            i += 1
+        self._pos = i
+        return completed
+
+    def _reset_root(self):
+        self._root_start = None
+        self._root_checked = False
+        self._in_string = False
+        self._escape = False
+        self._key = None
+        self._stack = []
+        self._item_start = None
+
+    def _is_target_array(self) -> bool:
+        return (len(self._stack) == 2 and self._stack[-1] == ("[", self.array_key)
+                and self._stack[0][0] == "{")
+
+    def result(self) -> Dict:
+        """解析完整的根对象；未完成或非法时回退到 extract_first_json_object"""
+        if self.complete and isinstance(self._root, dict):
+            return self._root
+        return extract_first_json_object(self.buffer)
@@ -0,0 +1,166 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from src.utils.telemetry import stage_scope
+
+_NO_FALLBACK = object()
+
+
+class StageError(RuntimeError):
+    """必需阶段失败 (且没有 fallback) 时抛出"""
+
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+
+class Stage:
+    """
+    流水线中的一个命名阶段
+
+    Args:
+        name: 阶段名
+        fn: 执行函数，接收依赖阶段的结果字典 {dep_name: result}
+        deps: 依赖的阶段名
+        timeout: 超时时间 (秒)，None 表示不限
+        fallback: 失败或超时时的兜底。可调用对象时以异常为参数调用，否则直接作为结果
+    """
+
+    def __init__(self, name: str, fn: Callable[[Dict[str, Any]], Any], deps: Iterable[str] = (),
+                 timeout: Optional[float] = None, fallback: Any = _NO_FALLBACK):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.fallback = fallback
+
+    def resolve_fallback(self, exc: BaseException) -> Any:
+        if self.fallback is _NO_FALLBACK:
+            raise StageError(self.name, exc) from exc
+        return self.fallback(exc) if callable(self.fallback) else self.fallback
+
+
+class StageGraph:
+    """
+    基于依赖关系的阶段调度器
+    所有依赖已满足的阶段并发执行，总耗时由关键路径决定，而不是各阶段耗时之和。
+    超时的阶段会立即使用 fallback 结果，其后台线程不再被等待。
+    """
+
+    def __init__(self, max_workers: int = 8, on_stage: Callable[[str, str, float], None] = None):
+        """
+        Args:
+            max_workers: 最大并发阶段数
+            on_stage: 阶段状态回调 (name, status, elapsed)，status 为 running/ok/fallback/timeout
+        """
+        self.max_workers = max_workers
+        self.on_stage = on_stage
+        self.stages: Dict[str, Stage] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, fn: Callable[[Dict[str, Any]], Any], deps: Iterable[str] = (),
+            timeout: Optional[float] = None, fallback: Any = _NO_FALLBACK) -> "StageGraph":
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        self.stages[name] = Stage(name, fn, deps, timeout, fallback)
+        return self
+
+    def _validate(self):
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+        # 环检测
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def run(self) -> Dict[str, Any]:
+        """
+        执行全部阶段
+
+        Returns:
+            {stage_name: result}
+        """
+        self._validate()
+        results: Dict[str, Any] = {}
+        pending = dict(self.stages)
+        running = {}  # future -> (stage, started_at)
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage")
+
+        def finish(stage: Stage, started: float, status: str, value: Any):
+            results[stage.name] = value
+            self.timings[stage.name] = {"status": status, "elapsed": round(time.time() - started, 3)}
+            print(f"[Pipeline] Stage '{stage.name}' {status} in {self.timings[stage.name]['elapsed']:.2f}s")
+            self._notify(stage.name, status, self.timings[stage.name]["elapsed"])
+
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(dep in results for dep in stage.deps):
+                        del pending[name]
+                        dep_results = {dep: results[dep] for dep in stage.deps}
+                        # 复制调用方上下文 (trace 等 contextvars)，并标记当前阶段
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, self._run_stage, stage, dep_results)] = (stage, time.time())
+                        self._notify(name, "running", 0.0)
+
+                if not running:
+                    raise StageError(",".join(pending), RuntimeError("unsatisfiable dependencies"))
+
+                now = time.time()
+                deadlines = [started + stage.timeout for stage, started in running.values() if stage.timeout]
+                wait_for = max(0.0, min(deadlines) - now) if deadlines else None
+                done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, started = running.pop(future)
+                    try:
+                        finish(stage, started, "ok", future.result())
+                    except StageError:
+                        raise
+                    except Exception as e:
+                        print(f"[Warning] Stage '{stage.name}' failed: {e}")
+                        finish(stage, started, "fallback", stage.resolve_fallback(e))
+
+                now = time.time()
+                for future, (stage, started) in list(running.items()):
+                    if stage.timeout and now - started >= stage.timeout:
+                        running.pop(future)
+                        future.cancel()
+                        print(f"[Warning] Stage '{stage.name}' timed out after {stage.timeout}s")
+                        finish(stage, started, "timeout",
+                               stage.resolve_fallback(TimeoutError(f"{stage.name} timed out")))
+        finally:
+            # 不等待超时阶段的后台线程
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        return results
+
+    @staticmethod
+    def _run_stage(stage: Stage, dep_results: Dict[str, Any]) -> Any:
+        with stage_scope(stage.name):
+            return stage.fn(dep_results)
+
+    def _notify(self, name: str, status: str, elapsed: float):
+        if not self.on_stage:
+            return
+        try:
+            self.on_stage(name, status, elapsed)
+        except Exception as e:
+            print(f"[Warning] Stage listener failed: {e}")
@@ -0,0 +1,57 @@
+import json
+
+# 仅供程序内部/前端使用，不应进入 Prompt 的字段
+INTERNAL_KEYS = {"budget_csv", "guide_file", "detailed_guide", "kg_job_id", "map_code"}
+
+
+def strip_internal(value):
+    """递归去除内部字段 (以 _ 开头或位于 INTERNAL_KEYS) 与空值"""
+    if isinstance(value, dict):
+        return {
+            k: strip_internal(v) for k, v in value.items()
+            if not k.startswith("_") and k not in INTERNAL_KEYS and v not in (None, "", [], {})
+        }
+    if isinstance(value, list):
+        return [strip_internal(v) for v in value]
+    return value
+
+
+def _fmt_cost(cost) -> str:
+    return f"¥{cost}" if cost not in (None, "", 0) else "免费"
+
+
+def _terse(plan: dict) -> str:
+    header = [f"目的地={plan.get('destination', '')}"]
+    if plan.get("duration_days"):
+        header.append(f"天数={plan['duration_days']}")
+    if plan.get("mode"):
+        header.append(f"模式={plan['mode']}")
+    if plan.get("total_budget_estimate") is not None:
+        header.append(f"总预算=¥{plan['total_budget_estimate']}")
+    lines = ["; ".join(header)]
+
+    for day in plan.get("itinerary", []):
+        lines.append(f"D{day.get('day', '?')} {day.get('date', '')}".rstrip())
+        acc = day.get("accommodation") or {}
+        if acc:
+            lines.append(f"  住: {acc.get('name', '')} {_fmt_cost(acc.get('cost'))} | {acc.get('reason', '')}".rstrip(" |"))
+        for act in day.get("activities", []):
+            fields = [f"  {act.get('time', '')} [{act.get('type', '')}] {act.get('name', '')} {_fmt_cost(act.get('cost'))}"]
+            for key in ("description", "tips", "source_id"):
+                if act.get(key):
+                    fields.append(str(act[key]))
+            lines.append(" | ".join(fields))
+    return "\n".join(lines)
+
+
+def encode_plan_for_llm(plan: dict, terse: bool = False) -> str:
+    """
+    将 Plan JSON 编码为面向 LLM 的紧凑文本
+
+    Args:
+        terse: True 时输出按天分行的简写格式，否则输出最小分隔符的 JSON
+    """
+    clean = strip_internal(plan or {})
+    if terse:
+        return _terse(clean)
+    return json.dumps(clean, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,118 @@
+import math
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.utils.dedup import normalize_text
+
+
+def char_ngrams(text: str, n: int = 2) -> List[str]:
+    """字符 n-gram 序列 (中文检索常用 bigram，无需分词)"""
+    norm = normalize_text(text)
+    if len(norm) < n:
+        return [norm] if norm else []
+    return [norm[i:i + n] for i in range(len(norm) - n + 1)]
+
+
+def engagement_of(doc: Dict) -> Optional[float]:
+    """互动量 (点赞数)，兼容 "1.2万" / "3k" 等写法；没有该字段时返回 None"""
+    value = doc.get("liked_count", doc.get("likes"))
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower()
+    scale = 1
+    for suffix, factor in (("万", 10000), ("w", 10000), ("k", 1000)):
+        if text.endswith(suffix):
+            text, scale = text[:-len(suffix)], factor
+            break
+    try:
+        return float(text) * scale
+    except ValueError:
+        return None
+
+
+def timestamp_of(doc: Dict) -> Optional[float]:
+    """发布时间 (秒级时间戳)；支持时间戳 (秒/毫秒) 与 YYYY-MM-DD[ HH:MM[:SS]] 字符串"""
+    value = doc.get("time", doc.get("publish_time"))
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000.0 if value > 1e11 else float(value)
+    text = str(value).strip().replace("/", "-").replace(".", "-")
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+class BM25Reranker:
+    """
+    本地相关性重排 (无外部服务)
+    score = w_bm25 * BM25 (字符 n-gram) + w_recency * 时效 + w_engagement * 互动量，各项归一化到 [0, 1]。
+    词频矩阵只统计查询中出现的 n-gram，BM25 与各项加权在 NumPy 中一次性批量计算。
+    缺少时间/互动字段的文档 (如网页结果) 取该项的中性值，不被惩罚。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, ngram: int = 2,
+                 weights: Sequence[float] = (0.7, 0.15, 0.15), half_life_days: float = 180.0):
+        self.k1 = k1
+        self.b = b
+        self.ngram = ngram
+        self.weights = weights
+        self.half_life_days = half_life_days
+
+    def score(self, query: str, docs: Sequence[Dict], text_of: Callable[[Dict], str]) -> np.ndarray:
+        n = len(docs)
+        if n == 0:
+            return np.zeros(0)
+        terms = list(dict.fromkeys(char_ngrams(query, self.ngram)))
+
+        # 词频矩阵 (文档 × 查询词) 与文档长度 (n-gram 个数)；str.count 在 C 层完成子串计数
+        texts = [normalize_text(text_of(doc)) for doc in docs]
+        doc_len = np.array([max(len(t) - self.ngram + 1, 1) for t in texts], dtype=float)
+        tf = np.array([[t.count(term) for term in terms] for t in texts], dtype=float).reshape(n, len(terms))
+
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        avg_len = doc_len.mean() or 1.0
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avg_len)
+        bm25 = (idf * tf * (self.k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+        w_bm25, w_recency, w_engagement = self.weights
+        return (w_bm25 * self._normalize(bm25)
+                + w_recency * self._recency(docs)
+                + w_engagement * self._engagement(docs))
+
+    def rerank(self, query: str, docs: Sequence[Dict], text_of: Callable[[Dict], str],
+               top_k: int = None) -> List[int]:
+        """返回按得分从高到低的下标 (得分相同保持原顺序)"""
+        scores = self.score(query, docs, text_of)
+        order = np.argsort(-scores, kind="stable")
+        return order[:top_k].tolist() if top_k else order.tolist()
+
+    @staticmethod
+    def _normalize(values: np.ndarray) -> np.ndarray:
+        top = values.max() if len(values) else 0.0
+        return values / top if top > 0 else np.zeros_like(values)
+
+    @staticmethod
+    def _fill_missing(values: np.ndarray) -> np.ndarray:
+        """缺失项 (NaN) 取已有值的均值；全部缺失时为 0.5"""
+        present = ~np.isnan(values)
+        fill = values[present].mean() if present.any() else 0.5
+        return np.where(present, values, fill)
+
+    def _recency(self, docs: Sequence[Dict]) -> np.ndarray:
+        stamps = np.array([timestamp_of(d) for d in docs], dtype=float)
+        age_days = np.clip((time.time() - stamps) / 86400.0, 0, None)
+        return self._fill_missing(np.exp(-age_days * math.log(2) / self.half_life_days))
+
+    def _engagement(self, docs: Sequence[Dict]) -> np.ndarray:
+        likes = np.array([engagement_of(d) for d in docs], dtype=float)
+        scaled = np.log1p(np.clip(likes, 0, None))
+        top = np.nanmax(scaled) if (~np.isnan(scaled)).any() else 0.0
+        return self._fill_missing(scaled / top if top > 0 else np.where(np.isnan(scaled), np.nan, 0.0))
@@ -0,0 +1,358 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from src.config import Config
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trlp_trace", default=None)
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("trlp_stage", default=None)
+_current_log_sink: contextvars.ContextVar = contextvars.ContextVar("trlp_log_sink", default=None)
+
+
+class RunTrace:
+    """
+    单次运行的追踪记录
+    - 各阶段耗时与状态
+    - LLM 调用的 token 用量 (来自 API usage 字段)、耗时与缓存命中
+    - 外部服务调用 (MCP / DeepSearch / Neo4j / Gemini / LLM) 耗时
+    """
+
+    def __init__(self, kind: str = "run_flow", **attrs):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.status = "running"
+        self.stages: Dict[str, Dict] = {}
+        self.llm_calls: List[Dict] = []
+        self.external_calls: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def record_stage(self, name: str, elapsed: float, status: str = "ok"):
+        with self._lock:
+            self.stages[name] = {"elapsed": round(elapsed, 4), "status": status}
+
+    def record_llm(self, latency: float, usage: Dict = None, cached: bool = False, stream: bool = False):
+        usage = usage or {}
+        with self._lock:
+            self.llm_calls.append({
+                "stage": _current_stage.get(),
+                "latency": round(latency, 4),
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0),
+                "cached": cached,
+                "stream": stream,
+            })
+
+    def record_external(self, service: str, op: str, latency: float, ok: bool):
+        with self._lock:
+            self.external_calls.append({
+                "service": service, "op": op, "stage": _current_stage.get(),
+                "latency": round(latency, 4), "ok": ok,
+            })
+
+    def finish(self, status: str = "ok"):
+        self.status = status
+        self.finished_at = time.time()
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            llm_calls = list(self.llm_calls)
+            return {
+                "run_id": self.run_id,
+                "kind": self.kind,
+                **self.attrs,
+                "status": self.status,
+                "started_at": self.started_at,
+                "wall_time": round((self.finished_at or time.time()) - self.started_at, 4),
+                "stages": dict(self.stages),
+                "llm": {
+                    "calls": len(llm_calls),
+                    "cache_hits": sum(1 for c in llm_calls if c["cached"]),
+                    "prompt_tokens": sum(c["prompt_tokens"] for c in llm_calls),
+                    "completion_tokens": sum(c["completion_tokens"] for c in llm_calls),
+                    "detail": llm_calls,
+                },
+                "external_calls": list(self.external_calls),
+            }
+
+
+def current_trace() -> Optional[RunTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace: RunTrace):
+    """在当前上下文中激活 trace (线程池中需配合 contextvars.copy_context 使用)"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def stage_scope(name: str):
+    """标记当前阶段，使 LLM / 外部调用记录带上阶段名"""
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+@contextmanager
+def track_external(service: str, op: str = "call"):
+    """统计一次外部服务调用的耗时与成败"""
+    started = time.time()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        latency = time.time() - started
+        metrics.observe_external(service, latency, ok)
+        trace = _current_trace.get()
+        if trace:
+            trace.record_external(service, op, latency, ok)
+
+
+class _ContextRoutedStdout:
+    """
+    sys.stdout 代理 (进程内只安装一次)
+    照常写入原始输出；若当前上下文绑定了日志接收器，则同时把完整的行转发给它。
+    各次运行的日志因此互不串扰，无需 redirect_stdout 替换全局 sys.stdout。
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def write(self, text: str):
+        sink = _current_log_sink.get()
+        if sink is not None and not getattr(self._local, "busy", False):
+            buffered = getattr(self._local, "buffer", "") + text
+            *lines, self._local.buffer = buffered.split("\n")
+            self._local.busy = True  # 接收器内部的 print 不再转发，避免递归
+            try:
+                for line in lines:
+                    if line.strip():
+                        sink(line)
+            except Exception:
+                pass
+            finally:
+                self._local.busy = False
+        return self._stream.write(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+_stdout_lock = threading.Lock()
+
+
+@contextmanager
+def use_log_sink(sink):
+    """在当前上下文中把 print 输出按行转发给 sink(line) (线程池中需配合 contextvars.copy_context 使用)"""
+    with _stdout_lock:
+        if not isinstance(sys.stdout, _ContextRoutedStdout):
+            sys.stdout = _ContextRoutedStdout(sys.stdout)
+    token = _current_log_sink.set(sink)
+    try:
+        yield
+    finally:
+        _current_log_sink.reset(token)
+
+
+def record_llm_call(latency: float, usage: Dict = None, cached: bool = False, stream: bool = False):
+    usage = usage or {}
+    metrics.observe_llm(_current_stage.get(), usage, cached)
+    trace = _current_trace.get()
+    if trace:
+        trace.record_llm(latency, usage, cached, stream)
+
+
+class _Histogram:
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """进程内指标聚合，渲染为 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs: Dict[tuple, int] = {}
+        self.stage_seconds: Dict[str, _Histogram] = {}
+        self.external_seconds: Dict[str, _Histogram] = {}
+        self.external_errors: Dict[str, int] = {}
+        self.llm_calls: Dict[str, int] = {}
+        self.llm_cache_hits: Dict[str, int] = {}
+        self.llm_tokens: Dict[tuple, int] = {}
+        self.plan_jobs: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+
+    def observe_run(self, trace: RunTrace):
+        with self._lock:
+            key = (trace.kind, trace.status)
+            self.runs[key] = self.runs.get(key, 0) + 1
+            for name, stage in trace.stages.items():
+                self.stage_seconds.setdefault(name, _Histogram()).observe(stage["elapsed"])
+
+    def observe_external(self, service: str, latency: float, ok: bool):
+        with self._lock:
+            self.external_seconds.setdefault(service, _Histogram()).observe(latency)
+            if not ok:
+                self.external_errors[service] = self.external_errors.get(service, 0) + 1
+
+    def observe_llm(self, stage: Optional[str], usage: Dict, cached: bool):
+        stage = stage or "unknown"
+        with self._lock:
+            self.llm_calls[stage] = self.llm_calls.get(stage, 0) + 1
+            if cached:
+                self.llm_cache_hits[stage] = self.llm_cache_hits.get(stage, 0) + 1
+            for kind in ("prompt", "completion"):
+                key = (stage, kind)
+                self.llm_tokens[key] = self.llm_tokens.get(key, 0) + usage.get(f"{kind}_tokens", 0)
+
+    def inc_plan_jobs(self, event: str):
+        """规划任务计数：submitted / coalesced / rejected / done / failed"""
+        with self._lock:
+            self.plan_jobs[event] = self.plan_jobs.get(event, 0) + 1
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        def header(name, mtype, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {mtype}")
+
+        def histogram(name, label, data):
+            for value, hist in sorted(data.items()):
+                for bound, count in zip(_Histogram.BUCKETS, hist.counts):
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {hist.total}')
+                lines.append(f'{name}_sum{{{label}="{value}"}} {hist.sum:.4f}')
+                lines.append(f'{name}_count{{{label}="{value}"}} {hist.total}')
+
+        with self._lock:
+            header("trlp_runs_total", "counter", "Finished pipeline runs")
+            for (kind, status), count in sorted(self.runs.items()):
+                lines.append(f'trlp_runs_total{{kind="{kind}",status="{status}"}} {count}')
+
+            header("trlp_stage_duration_seconds", "histogram", "Wall time per pipeline stage")
+            histogram("trlp_stage_duration_seconds", "stage", self.stage_seconds)
+
+            header("trlp_external_call_duration_seconds", "histogram", "External service call latency")
+            histogram("trlp_external_call_duration_seconds", "service", self.external_seconds)
+
+            header("trlp_external_call_errors_total", "counter", "Failed external service calls")
+            for service, count in sorted(self.external_errors.items()):
+                lines.append(f'trlp_external_call_errors_total{{service="{service}"}} {count}')
+
+            header("trlp_llm_calls_total", "counter", "Chat completion calls (including cache hits)")
+            for stage, count in sorted(self.llm_calls.items()):
+                lines.append(f'trlp_llm_calls_total{{stage="{stage}"}} {count}')
+
+            header("trlp_llm_cache_hits_total", "counter", "Chat completion calls served from cache")
+            for stage, count in sorted(self.llm_cache_hits.items()):
+                lines.append(f'trlp_llm_cache_hits_total{{stage="{stage}"}} {count}')
+
+            header("trlp_llm_tokens_total", "counter", "Tokens reported by the API usage field")
+            for (stage, kind), count in sorted(self.llm_tokens.items()):
+                lines.append(f'trlp_llm_tokens_total{{stage="{stage}",kind="{kind}"}} {count}')
+
+            header("trlp_plan_jobs_total", "counter", "Plan job queue events")
+            for event, count in sorted(self.plan_jobs.items()):
+                lines.append(f'trlp_plan_jobs_total{{event="{event}"}} {count}')
+
+            for name, value in sorted(self.gauges.items()):
+                header(f"trlp_{name}", "gauge", name.replace("_", " ").capitalize())
+                lines.append(f"trlp_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+_export_lock = threading.Lock()
+
+
+def export_trace(trace: RunTrace, path: str = None):
+    """结束时调用：写入 JSON Lines 并汇总到 Prometheus 指标"""
+    if trace.finished_at is None:
+        trace.finish()
+    metrics.observe_run(trace)
+    path = path or Config.TRACE_FILE
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+        with _export_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"[Warning] Trace export failed: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = None) -> Optional[ThreadingHTTPServer]:
+    """启动 /metrics 端点 (进程内只启动一次)；端口为 0/未配置时不启动"""
+    global _metrics_server
+    port = Config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _metrics_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                print(f"[Warning] Metrics server failed to start on :{port}: {e}")
+                return None
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+            print(f"📈 [Telemetry] Prometheus metrics at http://0.0.0.0:{port}/metrics")
+    return _metrics_server